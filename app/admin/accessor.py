@@ -1,11 +1,21 @@
-from typing import cast
+import json
+import logging
+from typing import TYPE_CHECKING, Any, Literal, cast
 
 from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import selectinload
+from sqlalchemy.sql.base import Executable
 
 from app.admin.models import AdminModel
-from app.bot.models import QuestionModel, ThemeModel
+from app.bot.models import CatalogVersionModel, QuestionModel, ThemeModel
 from app.core.accessor_base import BaseAccessor
+from app.core.manager import RabbitMQManager
+
+if TYPE_CHECKING:
+    from app.app import Application
+
+logger = logging.getLogger(__name__)
 
 
 class AdminAccessor(BaseAccessor):
@@ -39,6 +49,59 @@ class AdminAccessor(BaseAccessor):
 
 
 class ThemeAccessor(BaseAccessor):
+    def __init__(self, app: "Application"):
+        super().__init__(app)
+        # Подключается процессом админки, чтобы рассылать правки каталога
+        self.rabbit: RabbitMQManager | None = None
+
+    async def catalog_version(self) -> int:
+        exp = select(CatalogVersionModel.version).where(CatalogVersionModel.id == 1)
+        return await self.scalar(exp) or 0
+
+    async def bump_catalog_version(self) -> int:
+        # Upsert: строки может не быть, например после очистки базы фикстурами
+        values = pg_insert(CatalogVersionModel).values(id=1, version=1)
+        exp = values.on_conflict_do_update(
+            index_elements=[CatalogVersionModel.id],
+            set_={"version": CatalogVersionModel.version + 1},
+        ).returning(CatalogVersionModel.version)
+        return cast(int, await self.scalar(exp))
+
+    async def _write_catalog(
+        self,
+        exp: Executable,
+        kind: Literal["themes", "questions"],
+    ) -> Any:
+        # Запись и новая версия каталога в одной транзакции, рассылка — после.
+        # Потерянную рассылку боты догонят, сверяя версию по таймеру
+        async with self.session() as session, session.begin():
+            row = await self.scalar(exp)
+            version = await self.bump_catalog_version()
+        if row is None:
+            raise RuntimeError("Catalog write returned no row")
+
+        if self.rabbit is not None:
+            change: dict[str, Any] = {"version": version, "themes": [], "questions": []}
+            change[kind].append(row.id)
+            try:
+                await self.rabbit.publish(
+                    self.app.config.rabbitmq.catalog_exchange,
+                    json.dumps(change).encode(),
+                )
+            except Exception:
+                logger.exception("Не удалось разослать версию каталога %s", version)
+        return row
+
+    async def get_themes(self, ids: list[int] | None = None) -> list[ThemeModel]:
+        exp = select(ThemeModel)
+        if ids is not None:
+            exp = exp.where(ThemeModel.id.in_(ids))
+        return list(await self.scalars(exp))
+
+    async def get_questions(self, ids: list[int]) -> list[QuestionModel]:
+        exp = select(QuestionModel).where(QuestionModel.id.in_(ids))
+        return list(await self.scalars(exp))
+
     async def get_theme_by_id(self, theme_id: int) -> ThemeModel | None:
         exp = (
             select(ThemeModel)
@@ -57,7 +120,7 @@ class ThemeAccessor(BaseAccessor):
 
     async def create_theme(self, title: str) -> ThemeModel:
         exp = insert(ThemeModel).values(title=title).returning(ThemeModel)
-        return cast(ThemeModel, await self.scalar(exp))
+        return cast(ThemeModel, await self._write_catalog(exp, "themes"))
 
     async def get_question_by_id(self, question_id: int) -> QuestionModel | None:
         exp = (
@@ -83,4 +146,4 @@ class ThemeAccessor(BaseAccessor):
             .values(text=text, answer=answer, hard_level=hard_level, theme_id=theme_id)
             .returning(QuestionModel)
         )
-        return cast(QuestionModel, await self.scalar(exp))
+        return cast(QuestionModel, await self._write_catalog(exp, "questions"))
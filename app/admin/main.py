@@ -1,11 +1,33 @@
-from aiohttp.web import run_app
+from collections.abc import AsyncIterator
+from typing import cast
+
+from aiohttp.web import Application as AiohttpApplication, run_app
+
+from app.app import Application, setup_app
+from app.core.manager import RabbitMQManager
+
+
+async def rabbit_ctx(aiohttp_app: AiohttpApplication) -> AsyncIterator[None]:
+    # Рейтинг админки живёт в памяти и обновляется из той же fanout-рассылки.
+    # Правки каталога админка сама рассылает ботам
+    app = cast(Application, aiohttp_app)
+    rabbit = RabbitMQManager(
+        amqp_url=app.config.rabbitmq.url,
+        queue_name=app.config.rabbitmq.output_queue,
+    )
+    await rabbit.connect()
+    await app.bot_api.leaderboard_feed.start(rabbit)
+    app.accessors.theme_accessor.rabbit = rabbit
+    yield
+    app.accessors.theme_accessor.rabbit = None
+    await rabbit.close()
 
-from app.app import setup_app
 
 if __name__ == "__main__":
     app = setup_app()
 
     app.database.connect()
     app.on_startup.append(app.accessors.admin_accessor.connect)
+    app.cleanup_ctx.append(rabbit_ctx)
 
-    run_app(app)
\ No newline at end of file
+    run_app(app)
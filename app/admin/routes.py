@@ -8,11 +8,13 @@ def setup_routes(app: "Application"):
     from app.admin.views import (
         AdminCurrentView,
         AdminLoginView,
+        LeaderboardView,
         QuestionsView,
         ThemesView,
     )
 
     app.router.add_view("/admin/current", AdminCurrentView)
     app.router.add_view("/admin/login", AdminLoginView)
+    app.router.add_view("/admin/leaderboard", LeaderboardView)
     app.router.add_view("/admin/questions", QuestionsView)
     app.router.add_view("/admin/themes", ThemesView)
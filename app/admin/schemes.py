@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class AdminSchema(BaseModel):
@@ -59,3 +59,19 @@ class QuestionResponseSchema(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class LeaderboardEntrySchema(BaseModel):
+    rank: int
+    user_id: int
+    username: str
+    score: int
+
+    class Config:
+        from_attributes = True
+
+
+class LeaderboardQuerySchema(BaseModel):
+    user_id: int | None = None
+    limit: int = Field(10, ge=1, le=100)
+    offset: int = Field(0, ge=0)
@@ -1,9 +1,13 @@
+from collections.abc import Awaitable, Callable
 from functools import wraps
+from typing import Any
 
 from aiohttp.web import json_response as aiohttp_json_response
 from aiohttp.web_response import Response
 from pydantic import BaseModel, ValidationError
 
+Handler = Callable[..., Awaitable[Response]]
+
 
 def json_response(data: BaseModel | None = None, status: str = "ok") -> Response:
     data = {} if data is None else data.model_dump()
@@ -21,7 +25,7 @@ def error_json_response(
     status: str | None = None,
     message: str | None = None,
     data: dict | None = None,
-):
+) -> Response:
     return aiohttp_json_response(
         status=http_status,
         data={
@@ -47,3 +51,19 @@ def validate_json(model: type[BaseModel]):
 
         return wrapper
     return decorator
+
+
+def validate_query(model: type[BaseModel]) -> Callable[[Handler], Handler]:
+    def decorator(handler: Handler) -> Handler:
+        @wraps(handler)
+        async def wrapper(self: Any, *args: Any, **kwargs: Any) -> Response:
+            try:
+                self.request["data"] = model(**self.request.query)
+            except ValidationError as e:
+                return error_json_response(400, message=str(e))
+
+            return await handler(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,16 +1,24 @@
 from http import HTTPStatus
 
+from aiohttp.web import Response
 from aiohttp_session import new_session
 
 from app.admin.mixins import AuthRequiredMixin
 from app.admin.schemes import (
     AdminResponseSchema,
     AdminSchema,
+    LeaderboardEntrySchema,
+    LeaderboardQuerySchema,
     OkResponseSchema,
     QuestionResponseSchema,
     ThemeResponseSchema,
 )
-from app.admin.utils import error_json_response, json_response, validate_json
+from app.admin.utils import (
+    error_json_response,
+    json_response,
+    validate_json,
+    validate_query,
+)
 from app.app import View, app
 
 
@@ -63,4 +71,30 @@ class QuestionsView(AuthRequiredMixin, View):
         ]
         return json_response(
             OkResponseSchema(status="ok", data={"questions": questions_data})
-        )
\ No newline at end of file
+        )
+
+
+class LeaderboardView(AuthRequiredMixin, View):
+    @validate_query(LeaderboardQuerySchema)
+    async def get(self) -> Response:
+        query: LeaderboardQuerySchema = self.request["data"]
+        leaderboard = app.bot_api.leaderboard
+        if query.user_id is not None:
+            entry = leaderboard.rank(query.user_id)
+            if entry is None:
+                return error_json_response(
+                    HTTPStatus.NOT_FOUND,
+                    message="User not found in leaderboard",
+                )
+            return json_response(LeaderboardEntrySchema.model_validate(entry))
+
+        entries = [
+            LeaderboardEntrySchema.model_validate(entry).model_dump()
+            for entry in leaderboard.top(query.limit, query.offset)
+        ]
+        return json_response(
+            OkResponseSchema(
+                status="ok",
+                data={"total": len(leaderboard), "leaderboard": entries},
+            )
+        )
@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import TYPE_CHECKING
+
+from sqlalchemy import delete, func, insert, literal, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.app import setup_app
+from app.bot.models import GameModel, GameStatusEnum, TelegramUserModel
+from app.bot.schemas import Chat
+from app.core.accessor import transaction
+
+if TYPE_CHECKING:
+    from app.app import Application
+
+logger = logging.getLogger(__name__)
+
+# Игры бенчмарка ведёт BENCH_USER_ID, id настоящих пользователей положительные
+BENCH_USER_ID = -1
+BENCH_CHAT_OFFSET = -1_000_000_000
+
+
+def bench_chat_id(idx: int) -> int:
+    return BENCH_CHAT_OFFSET - idx
+
+
+async def seed(app: "Application", games: int, chats: int) -> None:
+    accessor = app.accessors.base_accessor
+    series = func.generate_series(1, games).table_valued("n")
+
+    async with transaction(accessor):
+        await accessor.execute(
+            pg_insert(TelegramUserModel)
+            .values(id=BENCH_USER_ID, username="benchmark")
+            .on_conflict_do_nothing(),
+        )
+        await accessor.execute(
+            insert(GameModel).from_select(
+                ["chat_id", "status", "master_id"],
+                select(
+                    BENCH_CHAT_OFFSET - series.c.n % chats,
+                    literal(GameStatusEnum.COMPLETED, GameModel.status.type),
+                    literal(BENCH_USER_ID),
+                ),
+            ),
+        )
+        # Каждый десятый чат получает идущую игру
+        await accessor.execute(
+            insert(GameModel).values(
+                [
+                    {
+                        "chat_id": bench_chat_id(idx),
+                        "status": GameStatusEnum.ROUND_1,
+                        "master_id": BENCH_USER_ID,
+                    }
+                    for idx in range(0, chats, 10)
+                ],
+            ),
+        )
+
+    async with accessor.session() as session:
+        await session.execute(text("ANALYZE game"))
+
+    logger.info("Засеяно %d завершённых игр в %d чатах", games, chats)
+
+
+async def cleanup(app: "Application", chats: int) -> None:
+    accessor = app.accessors.base_accessor
+    async with transaction(accessor):
+        await accessor.execute(
+            delete(GameModel)
+            .where(GameModel.master_id == BENCH_USER_ID)
+            .where(GameModel.chat_id <= BENCH_CHAT_OFFSET)
+            .where(GameModel.chat_id > BENCH_CHAT_OFFSET - chats),
+        )
+        await accessor.execute(
+            delete(TelegramUserModel).where(TelegramUserModel.id == BENCH_USER_ID),
+        )
+    logger.info("Данные бенчмарка удалены")
+
+
+async def measure(app: "Application", queries: int, chats: int) -> None:
+    accessor = app.accessors.game_accessor
+    latencies: list[float] = []
+
+    async with accessor.session():
+        for _ in range(queries):
+            chat = Chat(id=bench_chat_id(random.randrange(chats)))
+            started = time.perf_counter()
+            await accessor.get_active_game(chat)
+            latencies.append(time.perf_counter() - started)
+
+        plan = await accessor.all(
+            text(
+                "EXPLAIN ANALYZE SELECT * FROM game "
+                f"WHERE chat_id = {bench_chat_id(0)} AND status != 'COMPLETED'",
+            ),
+        )
+
+    latencies.sort()
+    logger.info(
+        "get_active_game: %d запросов, p50: %.3f мс, p99: %.3f мс",
+        len(latencies),
+        latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.99)] * 1000,
+    )
+    logger.info("План:\n%s", "\n".join(row[0] for row in plan))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Замеряет get_active_game на большой истории завершённых игр",
+    )
+    parser.add_argument("--games", type=int, default=1_000_000)
+    parser.add_argument("--chats", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument(
+        "--seed",
+        action="store_true",
+        help="Засеять данные в базу из конфига. Запускать только на отдельной базе",
+    )
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="Не удалять засеянные данные после замера",
+    )
+    args = parser.parse_args()
+
+    app = setup_app()
+    app.database.connect()
+    if app.database.engine is not None:
+        app.database.engine.echo = False
+
+    try:
+        if args.seed:
+            logger.info("Засеваем базу %s", app.config.database.database)
+            await seed(app, args.games, args.chats)
+        await measure(app, args.queries, args.chats)
+    finally:
+        if args.seed and not args.keep:
+            await cleanup(app, args.chats)
+        await app.database.disconnect()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.app import setup_app
+from app.bot.engine import GameEngine, GameState
+from app.bot.models import (
+    AnswerStatusEnum,
+    GameModel,
+    GameStatusEnum,
+    TelegramUserModel,
+    TelegramUserToRoundModel,
+)
+from app.bot.scheduler import ChatScheduler
+from app.core.accessor import transaction
+
+if TYPE_CHECKING:
+    from app.app import Application
+    from app.bot.accessor import GameAccessor
+
+logger = logging.getLogger(__name__)
+
+BENCH_CHAT_ID = -1_000_000_000
+QUESTION_ID = 1
+
+
+async def buzz_in(
+    accessor: "GameAccessor",
+    game_id: int,
+    user_id: int,
+    question_id: int,
+    round_id: int,
+) -> bool:
+    # Условный UPDATE: из одновременных нажатий строку получит только одно.
+    # Бот так больше не пишет, состояние игры ведёт GameEngine
+    exp = (
+        update(GameModel)
+        .where(GameModel.id == game_id, GameModel.active_user_id.is_(None))
+        .values(active_user_id=user_id)
+        .returning(GameModel.id)
+    )
+    if await accessor.scalar(exp) is None:
+        return False
+
+    exp1 = (
+        update(TelegramUserToRoundModel)
+        .where(
+            TelegramUserToRoundModel.user_id == user_id,
+            TelegramUserToRoundModel.question_id == question_id,
+            TelegramUserToRoundModel.round_id == round_id,
+        )
+        .values(state=AnswerStatusEnum.WAIT_ANSWERED)
+    )
+    await accessor.execute(exp1)
+    return True
+
+
+async def fire(
+    players: int,
+    press: Callable[[int], Awaitable[bool]],
+    latencies: list[float],
+) -> int:
+    async def one(user_id: int) -> bool:
+        started = time.perf_counter()
+        won = await press(user_id)
+        latencies.append(time.perf_counter() - started)
+        return won
+
+    user_ids = [-user_id for user_id in range(1, players + 1)]
+    return sum(await asyncio.gather(*(one(user_id) for user_id in user_ids)))
+
+
+async def bench_engine(
+    app: "Application",
+    players: int,
+    rounds: int,
+) -> tuple[list[float], list[int]]:
+    # Тот же путь, что проходит воркер: очередь чата и compare-and-set в памяти
+    engine = GameEngine(app)
+    scheduler = ChatScheduler(concurrency=players, idle_timeout=1)
+    latencies: list[float] = []
+    winners: list[int] = []
+
+    for _ in range(rounds):
+        state = GameState(
+            game_id=0,
+            chat_id=BENCH_CHAT_ID,
+            master_id=0,
+            status=GameStatusEnum.ROUND_1,
+            round_id=0,
+            base_score=100,
+            active_user_id=None,
+            choice_user_id=None,
+        )
+        for user_id in range(1, players + 1):
+            state.answers[QUESTION_ID, -user_id] = AnswerStatusEnum.NOT_ANSWERED
+
+        async def press(user_id: int, state: GameState = state) -> bool:
+            won = False
+
+            async def job() -> None:
+                nonlocal won
+                # Воркер отдаёт цикл событий на вводе-выводе до проверки
+                await asyncio.sleep(0)
+                won = engine.buzz_in(state, user_id, QUESTION_ID)
+
+            await scheduler.run(state.chat_id, job)
+            return won
+
+        winners.append(await fire(players, press, latencies))
+    return latencies, winners
+
+
+async def bench_database(
+    app: "Application",
+    players: int,
+    rounds: int,
+) -> tuple[list[float], list[int]]:
+    # Каждое нажатие в своей сессии, как будто от разных воркеров
+    app.database.connect()
+    if app.database.engine is not None:
+        app.database.engine.echo = False
+
+    accessor = app.accessors.game_accessor
+    user_ids = [-user_id for user_id in range(1, players + 1)]
+    async with transaction(accessor):
+        await accessor.execute(
+            delete(GameModel).where(GameModel.chat_id == BENCH_CHAT_ID),
+        )
+        await accessor.execute(
+            pg_insert(TelegramUserModel).on_conflict_do_nothing(),
+            [{"id": uid, "username": f"bench{-uid}"} for uid in user_ids],
+        )
+        created = await accessor.scalar(
+            insert(GameModel)
+            .values(
+                chat_id=BENCH_CHAT_ID,
+                status=GameStatusEnum.ROUND_1,
+                master_id=user_ids[0],
+            )
+            .returning(GameModel.id),
+        )
+
+    if created is None:
+        raise RuntimeError("Не удалось создать игру бенчмарка")
+    game_id: int = created
+
+    latencies: list[float] = []
+    winners: list[int] = []
+
+    async def press(user_id: int) -> bool:
+        async with accessor.session() as session, session.begin():
+            return await buzz_in(accessor, game_id, user_id, QUESTION_ID, 0)
+
+    try:
+        for _ in range(rounds):
+            await accessor.execute(
+                update(GameModel)
+                .where(GameModel.id == game_id)
+                .values(active_user_id=None),
+            )
+            winners.append(await fire(players, press, latencies))
+    finally:
+        async with transaction(accessor):
+            await accessor.execute(delete(GameModel).where(GameModel.id == game_id))
+            await accessor.execute(
+                delete(TelegramUserModel).where(TelegramUserModel.id.in_(user_ids)),
+            )
+        await app.database.disconnect()
+    return latencies, winners
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Одновременные нажатия «Ответить»: ровно один победитель",
+    )
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument(
+        "--database",
+        action="store_true",
+        help="Проверять условный UPDATE в базе вместо очереди чата",
+    )
+    args = parser.parse_args()
+
+    bench = bench_database if args.database else bench_engine
+    latencies, winners = await bench(setup_app(), args.players, args.rounds)
+
+    latencies.sort()
+    logger.info(
+        "%d раундов по %d нажатий, p50: %.3f мс, p99: %.3f мс",
+        args.rounds,
+        args.players,
+        latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.99)] * 1000,
+    )
+    broken = [count for count in winners if count != 1]
+    if broken:
+        logger.error("Раундов не с одним победителем: %d", len(broken))
+        raise SystemExit(1)
+    logger.info("В каждом раунде ровно один победитель")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1,10 +1,27 @@
-from typing import cast
-
-from sqlalchemy import exists, func, insert, select, update
-from sqlalchemy.orm import selectinload
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Callable, Iterable
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, cast
+
+from sqlalchemy import (
+    Integer,
+    Row,
+    String,
+    delete,
+    func,
+    literal,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.bot.models import (
     AnswerStatusEnum,
+    BotWorkerModel,
+    CallbackTokenModel,
+    ChatHistoryModel,
     GameModel,
     GameStatusEnum,
     QuestionModel,
@@ -15,59 +32,189 @@ from app.bot.models import (
     TelegramUserModel,
     TelegramUserToGameModel,
     TelegramUserToRoundModel,
-    ThemeModel,
     ThemeToRoundModel,
 )
 from app.bot.schemas import Chat, Message, User
 from app.core.accessor_base import BaseAccessor
+from app.core.metrics import metrics
+
+if TYPE_CHECKING:
+    from app.app import Application
+
+# Функция из sqlalchemy не аннотирована
+_set_committed_value = cast(Callable[[Any, str, Any], None], set_committed_value)
+
+# Статус подставляется литералом. Для параметра generic-план подготовленного
+# запроса не сможет использовать частичный индекс ix_game_chat_id_active
+ACTIVE_GAME = GameModel.status != literal(
+    GameStatusEnum.COMPLETED,
+    GameModel.status.type,
+    literal_execute=True,
+)
 
 
 class UserAccessor(BaseAccessor):
-    async def get_or_create(self, tele_user: User) -> TelegramUserModel:
-        exp = select(TelegramUserModel).where(TelegramUserModel.id == tele_user.id)
-        if (user := await self.scalar(exp)) is not None:
-            return cast(TelegramUserModel, user)
+    def __init__(self, app: "Application"):
+        super().__init__(app)
+        # user_id -> username, уже записанный в базу
+        self._seen: OrderedDict[int, str] = OrderedDict()
 
-        exp1 = (
-            insert(TelegramUserModel)
-            .values(id=tele_user.id, username=tele_user.username)
-            .returning(TelegramUserModel)
-        )
-        return cast(TelegramUserModel, await self.scalar(exp1))
+    async def _remember(self, user_id: int, username: str) -> None:
+        self._seen[user_id] = username
+        self._seen.move_to_end(user_id)
+        if len(self._seen) > self.app.config.bot.user_cache_size:
+            self._seen.popitem(last=False)
+
+    async def get_or_create(self, tele_user: User) -> TelegramUserModel:
+        # Один запрос и для нового игрока, и для смены username
+        values = insert(TelegramUserModel).values(
+            id=tele_user.id,
+            username=tele_user.username,
+        )
+        exp = values.on_conflict_do_update(
+            index_elements=[TelegramUserModel.id],
+            set_={"username": values.excluded.username},
+        ).returning(TelegramUserModel)
+        user = cast(TelegramUserModel, await self.scalar(exp))
+        # Кеш получает только закоммиченную запись: при откате апдейта
+        # игрока в базе нет, и следующий ensure() обязан вставить запись заново
+        user_id, username = user.id, user.username
+        await self.app.bot_api.after_commit(
+            lambda: self._remember(user_id, username),
+        )
+        return user
+
+    async def ensure(self, tele_user: User) -> None:
+        # Недавно виденный игрок, чей username не менялся, не стоит ни одного запроса
+        if self._seen.get(tele_user.id) == tele_user.username:
+            self._seen.move_to_end(tele_user.id)
+            metrics.inc("user_cache", result="hit")
+            return
+
+        metrics.inc("user_cache", result="miss")
+        await self.get_or_create(tele_user)
 
     async def get_by_id(self, user_id: int) -> TelegramUserModel:
         exp = select(TelegramUserModel).where(TelegramUserModel.id == user_id)
         return await self.scalar(exp)
 
+    async def stream_scores(
+        self,
+        batch_size: int = 10_000,
+    ) -> AsyncGenerator[Row[tuple[int, str, int]], None]:
+        # Серверный курсор: всю таблицу в память не тянем
+        exp = select(
+            TelegramUserModel.id,
+            TelegramUserModel.username,
+            TelegramUserModel.score,
+        ).execution_options(yield_per=batch_size)
+        async with self.session() as session:
+            async for row in await session.stream(exp):
+                yield row
 
-class GameAccessor(BaseAccessor):  # noqa: PLR0904
-    async def complete(self, game: GameModel) -> None:
-        exp = (
-            update(GameModel)
-            .where(GameModel.id == game.id)
-            .values(status=GameStatusEnum.COMPLETED)
+
+class CallbackTokenAccessor(BaseAccessor):
+    async def create(self, token: str, payload: bytes) -> str:
+        await self.execute(
+            insert(CallbackTokenModel).values(token=token, payload=payload),
+        )
+        return token
+
+    async def get(self, token: str) -> bytes | None:
+        exp = select(CallbackTokenModel.payload).where(
+            CallbackTokenModel.token == token,
+        )
+        return await self.scalar(exp)
+
+    async def delete_expired(self, ttl: float) -> int:
+        exp = delete(CallbackTokenModel).where(
+            CallbackTokenModel.create_at < datetime.utcnow() - timedelta(seconds=ttl),
+        )
+        result = await self.execute(exp)
+        return cast(int, getattr(result, "rowcount", 0))
+
+
+class WorkerAccessor(BaseAccessor):
+    async def heartbeat(self, worker_id: str) -> None:
+        exp = insert(BotWorkerModel).values(id=worker_id, heartbeat_at=func.now())
+        exp = exp.on_conflict_do_update(
+            index_elements=[BotWorkerModel.id],
+            set_={"heartbeat_at": func.now()},
         )
         await self.execute(exp)
 
-    async def get_active_game(self, chat: Chat) -> GameModel | None:
+    async def live_workers(self, ttl: float) -> list[str]:
         exp = (
-            select(GameModel)
-            .where(GameModel.chat_id == chat.id)
-            .where(GameModel.status != GameStatusEnum.COMPLETED)
+            select(BotWorkerModel.id)
+            .where(BotWorkerModel.heartbeat_at > func.now() - timedelta(seconds=ttl))
+            .order_by(BotWorkerModel.id)
         )
+        return list(await self.scalars(exp))
+
+    async def remove(self, worker_id: str) -> None:
+        await self.execute(delete(BotWorkerModel).where(BotWorkerModel.id == worker_id))
+
+
+class HistoryAccessor(BaseAccessor):
+    async def get(self, chat_id: int) -> ChatHistoryModel | None:
+        exp = select(ChatHistoryModel).where(ChatHistoryModel.chat_id == chat_id)
         return await self.scalar(exp)
 
-    async def get(self, chat_id: int, master_id: int) -> GameModel | None:
+    async def save(
+        self,
+        chat_id: int,
+        current: bytes,
+        previous: bytes,
+        epoch_at: datetime,
+    ) -> None:
+        values = {"current": current, "previous": previous, "epoch_at": epoch_at}
+        exp = insert(ChatHistoryModel).values(chat_id=chat_id, **values)
+        exp = exp.on_conflict_do_update(
+            index_elements=[ChatHistoryModel.chat_id],
+            set_=values,
+        )
+        await self.execute(exp)
+
+
+class GameAccessor(BaseAccessor):
+    async def _update_game(self, game: GameModel, **values: Any) -> None:
+        exp = update(GameModel).where(GameModel.id == game.id).values(**values)
+        await self.execute(exp)
+        self._sync_game(game, **values)
+
+    def _sync_game(self, game: GameModel, **values: Any) -> None:
+        # Держим объект из identity map в актуальном состоянии
+        for key, value in values.items():
+            _set_committed_value(game, key, value)
+
+        identity_map = self.get_identity_map()
+        if identity_map is not None and game.status == GameStatusEnum.COMPLETED:
+            identity_map["active_game", game.chat_id] = None
+
+    async def complete(self, game: GameModel) -> None:
+        await self._update_game(game, status=GameStatusEnum.COMPLETED)
+
+    async def get_active_game(self, chat: Chat) -> GameModel | None:
+        identity_map = self.get_identity_map()
+        key = ("active_game", chat.id)
+        if identity_map is not None and key in identity_map:
+            return cast(GameModel | None, identity_map[key])
+
         exp = (
             select(GameModel)
-            .where(GameModel.chat_id == chat_id)
-            .where(GameModel.master_id == master_id)
-            .where(GameModel.status != GameStatusEnum.COMPLETED)
+            .where(GameModel.chat_id == chat.id)
+            .where(ACTIVE_GAME)
         )
-        return await self.scalar(exp)
+        game = await self.scalar(exp)
+        if identity_map is not None:
+            identity_map[key] = game
+        return game
 
-    async def get_by_id(self, game_id: int) -> GameModel | None:
-        return await self.scalar(select(GameModel).where(GameModel.id == game_id))
+    async def get(self, chat_id: int, master_id: int) -> GameModel | None:
+        game = await self.get_active_game(Chat(id=chat_id))
+        if game is None or game.master_id != master_id:
+            return None
+        return game
 
     async def create(self, chat_id: int, master_id: int) -> GameModel:
         if (game := await self.get(chat_id, master_id)) is not None:
@@ -78,10 +225,15 @@ class GameAccessor(BaseAccessor):  # noqa: PLR0904
             .values(chat_id=chat_id, master_id=master_id, status=GameStatusEnum.LOBBY)
             .returning(GameModel)
         )
-        return cast(GameModel, await self.scalar(exp))
+        game = cast(GameModel, await self.scalar(exp))
+
+        identity_map = self.get_identity_map()
+        if identity_map is not None:
+            identity_map["active_game", chat_id] = game
+        return game
 
     async def add_player(self, user: User, game_chat: Chat) -> bool:
-        await self.app.accessors.user_accessor.get_or_create(user)
+        await self.app.accessors.user_accessor.ensure(user)
         exp = (
             select(TelegramUserToGameModel)
             .join(GameModel, TelegramUserToGameModel.game_id == GameModel.id)
@@ -116,30 +268,23 @@ class GameAccessor(BaseAccessor):  # noqa: PLR0904
             )
             .join(GameModel, TelegramUserToGameModel.game_id == GameModel.id)
             .where(GameModel.chat_id == chat.id)
-            .where(GameModel.status != GameStatusEnum.COMPLETED)
+            .where(ACTIVE_GAME)
         )
         return list(await self.scalars(exp))
 
-    async def next_round(self, chat: Chat) -> bool:
+    async def next_round(
+        self,
+        chat: Chat,
+        theme_ids: list[int],
+    ) -> list[list[QuestionToThemeModel]] | None:
         game = await self.get_active_game(chat)
         if game is None:
             raise RuntimeError("Game not found")
 
         if game.status == GameStatusEnum.ROUND_1:
-            exp = (
-                update(GameModel)
-                .where(GameModel.id == game.id)
-                .values(status=GameStatusEnum.COMPLETED)
-            )
-            await self.execute(exp)
-            return False  # Next?
+            return None  # Next? Игру завершает finalize
 
-        exp = (
-            update(GameModel)
-            .where(GameModel.id == game.id)
-            .values(status=GameStatusEnum.ROUND_1)
-        )
-        await self.execute(exp)
+        await self._update_game(game, status=GameStatusEnum.ROUND_1)
 
         exp1 = (
             insert(RoundModel).values(type=RoundTypeEnum.ROUND_1).returning(RoundModel)
@@ -148,38 +293,53 @@ class GameAccessor(BaseAccessor):  # noqa: PLR0904
         if round_ is None:
             raise RuntimeError("Round not found")
 
-        exp2 = (
-            insert(RoundToGameModel)
-            .values(game_id=game.id, round_id=round_.id)
-            .returning(RoundToGameModel)
-        )
+        exp2 = insert(RoundToGameModel).values(game_id=game.id, round_id=round_.id)
         await self.execute(exp2)
 
-        exp3 = (
-            select(ThemeModel)
-            .options(selectinload(ThemeModel.questions))
-            .order_by(func.random())
-            .limit(3)
-        )
-        themes = await self.scalars(exp3)
-
-        for theme in themes:
-            exp4 = insert(ThemeToRoundModel).values(
-                theme_id=theme.id, round_id=round_.id
+        # Темы и все их вопросы раскладываются одним запросом, он же через
+        # RETURNING отдаёт готовую доску раунда
+        board: list[QuestionToThemeModel] = []
+        if theme_ids:
+            themes = (
+                insert(ThemeToRoundModel)
+                .values([{"theme_id": tid, "round_id": round_.id} for tid in theme_ids])
+                .returning(ThemeToRoundModel.theme_id)
+                .cte("themes")
             )
-            await self.execute(exp4)
-
-            for question in theme.questions:
-                exp5 = insert(QuestionToThemeModel).values(
-                    question_id=question.id,
-                    theme_id=theme.id,
-                    round_id=round_.id,
+            exp3 = (
+                insert(QuestionToThemeModel)
+                .from_select(
+                    ["question_id", "theme_id", "round_id", "status"],
+                    select(
+                        QuestionModel.id,
+                        QuestionModel.theme_id,
+                        literal(round_.id),
+                        literal(
+                            AnswerStatusEnum.NOT_ANSWERED,
+                            QuestionToThemeModel.status.type,
+                        ),
+                    ).join(themes, QuestionModel.theme_id == themes.c.theme_id),
                 )
-                await self.execute(exp5)
-        return True  # Next?
+                .returning(QuestionToThemeModel)
+            )
+            board = list(await self.scalars(exp3))
+
+        identity_map = self.get_identity_map()
+        if identity_map is not None:
+            identity_map["current_round", game.id, game.status] = round_
+        return self._group_board(board)
 
     async def get_current_round(self, chat: Chat) -> RoundModel:
         game = await self.get_active_game(chat)
+        if game is None:
+            raise RuntimeError("Game not found")
+
+        # Статус в ключе: при смене раунда кеш устаревает сам
+        identity_map = self.get_identity_map()
+        key = ("current_round", game.id, game.status)
+        if identity_map is not None and key in identity_map:
+            return cast(RoundModel, identity_map[key])
+
         exp = (
             select(RoundModel)
             .join(RoundToGameModel, RoundModel.id == RoundToGameModel.round_id)
@@ -188,202 +348,62 @@ class GameAccessor(BaseAccessor):  # noqa: PLR0904
                 RoundToGameModel.game_id == game.id,
             )
         )
-        return await self.scalar(exp)
+        round_ = await self.scalar(exp)
+        if identity_map is not None:
+            identity_map[key] = round_
+        return round_
 
     async def all_questions(self, chat: Chat) -> list[list[QuestionToThemeModel]]:
         round_ = await self.get_current_round(chat)
         if round_ is None:
             return []
+        return await self.round_board(round_.id)
 
+    async def round_board(self, round_id: int) -> list[list[QuestionToThemeModel]]:
+        # Только раскладка раунда: тексты и темы берутся из каталога
         stmt = (
             select(QuestionToThemeModel)
-            .where(QuestionToThemeModel.round_id == round_.id)
-            .options(
-                selectinload(QuestionToThemeModel.question),
-                selectinload(QuestionToThemeModel.theme),
-            )
+            .where(QuestionToThemeModel.round_id == round_id)
             .order_by(QuestionToThemeModel.theme_id)
         )
 
-        records = await self.scalars(stmt)
+        return self._group_board(await self.scalars(stmt))
 
+    @staticmethod
+    def _group_board(
+        records: Iterable[QuestionToThemeModel],
+    ) -> list[list[QuestionToThemeModel]]:
+        # RETURNING порядок строк не гарантирует, поэтому темы сортируем здесь
         grouped: dict[int, list[QuestionToThemeModel]] = {}
         for item in records:
             grouped.setdefault(item.theme_id, []).append(item)
 
-        return list(grouped.values())
-
-    async def set_choice_user(
-        self,
-        chat: Chat,
-        choice: TelegramUserModel,
-    ) -> TelegramUserModel:
-        game = await self.get_active_game(chat)
-
-        exp = (
-            update(GameModel)
-            .where(GameModel.id == game.id)
-            .values(choice_user_id=choice.id)
-        )
-        await self.execute(exp)
-        return choice
-
-    async def set_active_user_null(self, chat: Chat) -> None:
-        game = await self.get_active_game(chat)
-
-        exp = (
-            update(GameModel).where(GameModel.id == game.id).values(active_user_id=None)
-        )
-        await self.execute(exp)
-
-    async def set_active_user(
-        self,
-        chat: Chat,
-        active: User,
-        user_id: int,
-        question_id: int,
-        round_id: int,
-    ) -> None:
-        game = await self.get_active_game(chat)
+        return [grouped[theme_id] for theme_id in sorted(grouped)]
 
+    async def get_question_by_message(self, message: Message) -> QuestionModel | None:
+        # Игра, раунд, ожидаемый ответ и тема одним запросом
         exp = (
-            update(GameModel)
-            .where(GameModel.id == game.id)
-            .values(active_user_id=active.id)
-        )
-        await self.execute(exp)
-
-        exp1 = (
-            update(TelegramUserToRoundModel)
-            .where(
-                TelegramUserToRoundModel.user_id == user_id,
-                TelegramUserToRoundModel.question_id == question_id,
-                TelegramUserToRoundModel.round_id == round_id,
-            )
-            .values(state=AnswerStatusEnum.WAIT_ANSWERED)
-        )
-        await self.execute(exp1)
-
-    async def get_question_by_message(
-        self, msg_or_call: Message
-    ) -> QuestionModel:
-        round_ = await self.get_current_round(msg_or_call.chat)
-
-        exp1 = (
-            select(TelegramUserToRoundModel)
-            .where(TelegramUserToRoundModel.user_id == msg_or_call.from_.id)
-            .where(TelegramUserToRoundModel.round_id == round_.id)
-            .where(TelegramUserToRoundModel.state == AnswerStatusEnum.WAIT_ANSWERED)
-        )
-        res = await self.scalar(exp1)
-        question_id, round_id = res.question_id, res.round_id
-
-        exp2 = select(QuestionModel).where(QuestionModel.id == question_id)
-        theme_id = (await self.scalar(exp2)).theme_id
-
-        exp = select(QuestionToThemeModel).where(
-            QuestionToThemeModel.round_id == round_id,
-            QuestionToThemeModel.theme_id == theme_id,
-            QuestionToThemeModel.question_id == question_id,
-        )
-        question_to_theme = await self.scalar(exp)
-
-        exp1 = (
             select(QuestionModel)
-            .options(selectinload(QuestionModel.theme))
-            .where(QuestionModel.id == question_to_theme.question_id)
-        )
-
-        return await self.scalar(exp1)
-
-    async def get_active_user(self, chat: Chat) -> TelegramUserModel | None:
-        game = await self.get_active_game(chat)
-        if game is None:
-            return None
-
-        exp = select(TelegramUserModel).where(
-            TelegramUserModel.id == game.active_user_id
-        )
-        return await self.scalar(exp)
-
-    async def set_user_answered(
-        self,
-        user_id: int,
-        question_id: int,
-        round_id: int,
-    ) -> None:
-        exp = (
-            update(TelegramUserToRoundModel)
-            .where(
-                TelegramUserToRoundModel.user_id == user_id,
-                TelegramUserToRoundModel.question_id == question_id,
-                TelegramUserToRoundModel.round_id == round_id,
-            )
-            .values(state=AnswerStatusEnum.ANSWERED)
-        )
-        await self.execute(exp)
-
-    async def is_answered(self, user_id: int, question_id: int, round_id: int) -> bool:
-        exp = select(TelegramUserToRoundModel).where(
-            TelegramUserToRoundModel.user_id == user_id,
-            TelegramUserToRoundModel.question_id == question_id,
-            TelegramUserToRoundModel.round_id == round_id,
-            TelegramUserToRoundModel.state == AnswerStatusEnum.ANSWERED,
-        )
-        return await self.scalar(exp) is not None
-
-    async def get_question_by_user_round(
-        self,
-        user_id: int,
-        question_id: int,
-        round_: RoundModel,
-    ) -> QuestionModel:
-        exp = (
-            select(TelegramUserToRoundModel)
-            .options(selectinload(TelegramUserToRoundModel.question))
-            .where(
-                TelegramUserToRoundModel.user_id == user_id,
-                TelegramUserToRoundModel.round_id == round_.id,
-                TelegramUserToRoundModel.question_id == question_id,
-                TelegramUserToRoundModel.state == AnswerStatusEnum.ANSWERED,
-            )
-        )
-        res = await self.scalar(exp)
-        return res.question
-
-    async def add_score(self, user_id: int, game_id: int, score: int) -> None:
-        exp = (
-            update(TelegramUserToGameModel)
-            .where(
-                TelegramUserToGameModel.user_id == user_id,
-                TelegramUserToGameModel.game_id == game_id,
+            .join(
+                TelegramUserToRoundModel,
+                TelegramUserToRoundModel.question_id == QuestionModel.id,
             )
-            .values(
-                score=TelegramUserToGameModel.score + score,
+            .join(
+                RoundToGameModel,
+                RoundToGameModel.round_id == TelegramUserToRoundModel.round_id,
             )
-        )
-        await self.execute(exp)
-
-    async def set_question_answered(
-        self, theme_id: int, question_id: int, round_id: int
-    ) -> None:
-        exp = (
-            update(QuestionToThemeModel)
+            .join(RoundModel, RoundModel.id == RoundToGameModel.round_id)
+            .join(GameModel, GameModel.id == RoundToGameModel.game_id)
             .where(
-                QuestionToThemeModel.theme_id == theme_id,
-                QuestionToThemeModel.question_id == question_id,
-                QuestionToThemeModel.round_id == round_id,
+                GameModel.chat_id == message.chat.id,
+                ACTIVE_GAME,
+                GameModel.active_user_id == message.from_.id,
+                # Типы enum разные, сравниваем по тексту
+                RoundModel.type.cast(String) == GameModel.status.cast(String),
+                TelegramUserToRoundModel.user_id == message.from_.id,
+                TelegramUserToRoundModel.state == AnswerStatusEnum.WAIT_ANSWERED,
             )
-            .values(status=AnswerStatusEnum.ANSWERED)
-        )
-        await self.execute(exp)
-
-    async def has_questions(self, round_: RoundModel) -> bool:
-        exp = select(
-            exists(QuestionToThemeModel).where(
-                QuestionToThemeModel.round_id == round_.id,
-                QuestionToThemeModel.status == AnswerStatusEnum.NOT_ANSWERED,
-            ),
+            .options(joinedload(QuestionModel.theme))
         )
         return await self.scalar(exp)
 
@@ -395,66 +415,99 @@ class GameAccessor(BaseAccessor):  # noqa: PLR0904
         )
         return list(await self.scalars(exp))
 
-    async def summarize(self, profile: TelegramUserToGameModel, is_win: bool) -> None:
+    async def finalize(
+        self,
+        game: GameModel,
+    ) -> list[Row[tuple[int, str, int, int, int]]]:
+        # Итоги всех игроков и завершение игры одним запросом
+        ranked = (
+            select(
+                TelegramUserToGameModel.user_id,
+                TelegramUserToGameModel.score,
+                func.rank()
+                .over(order_by=TelegramUserToGameModel.score.desc())
+                .label("place"),
+            )
+            .where(TelegramUserToGameModel.game_id == game.id)
+            .cte("ranked")
+        )
+        completed = (
+            update(GameModel)
+            .where(GameModel.id == game.id)
+            .values(status=GameStatusEnum.COMPLETED)
+            .cte("completed")
+        )
+        is_win = ranked.c.place == 1
         exp = (
             update(TelegramUserModel)
-            .where(TelegramUserModel.id == profile.user_id)
+            .where(TelegramUserModel.id == ranked.c.user_id)
             .values(
-                score=TelegramUserModel.score + profile.score,
-                win_count=(
-                    TelegramUserModel.win_count + 1
-                    if is_win
-                    else TelegramUserModel.win_count
-                ),
-                loss_count=(
-                    TelegramUserModel.loss_count + 1
-                    if not is_win
-                    else TelegramUserModel.loss_count
-                ),
+                score=TelegramUserModel.score + ranked.c.score,
+                win_count=TelegramUserModel.win_count + is_win.cast(Integer),
+                loss_count=TelegramUserModel.loss_count + (~is_win).cast(Integer),
             )
+            .returning(
+                TelegramUserModel.id,
+                TelegramUserModel.username,
+                ranked.c.score,
+                ranked.c.place,
+                TelegramUserModel.score.label("total"),
+            )
+            .add_cte(completed)
         )
-        await self.execute(exp)
+        rows = list(await self.all(exp))
+        self._sync_game(game, status=GameStatusEnum.COMPLETED)
+        return sorted(rows, key=lambda row: (row.place, -row.score))
 
-    async def generate_users_answer_status(
-        self,
-        chat: Chat,
-        question_id: int,
-        round_id: int,
-    ) -> None:
-        users = await self.all_users(chat)
+    async def round_answers(self, round_id: int) -> list[TelegramUserToRoundModel]:
+        exp = select(TelegramUserToRoundModel).where(
+            TelegramUserToRoundModel.round_id == round_id,
+        )
+        return list(await self.scalars(exp))
 
-        for user in users:
-            exp = insert(TelegramUserToRoundModel).values(
-                user_id=user.id,
-                question_id=question_id,
-                round_id=round_id,
-            )
-            await self.execute(exp)
+    async def bulk_update_games(self, rows: list[dict[str, Any]]) -> None:
+        await self.execute(update(GameModel), rows)
 
-    async def has_user_not_answered(self, round_id: int, question_id: int) -> bool:
-        exp = select(
-            exists(TelegramUserToRoundModel).where(
-                TelegramUserToRoundModel.question_id == question_id,
-                TelegramUserToRoundModel.round_id == round_id,
-                TelegramUserToRoundModel.state == AnswerStatusEnum.NOT_ANSWERED,
-            )
-        )
-        return await self.scalar(exp)
+    async def bulk_update_scores(self, rows: list[dict[str, Any]]) -> None:
+        await self.execute(update(TelegramUserToGameModel), rows)
 
-    async def has_answer(self, user_id: int, round_id: int, question_id: int) -> bool:
-        exp = (
-            select(TelegramUserToRoundModel)
-            .where(
-                TelegramUserToRoundModel.user_id == user_id,
-                TelegramUserToRoundModel.question_id == question_id,
-                TelegramUserToRoundModel.round_id == round_id,
-            )
+    async def bulk_update_questions(self, rows: list[dict[str, Any]]) -> None:
+        await self.execute(update(QuestionToThemeModel), rows)
+
+    async def upsert_answers(self, rows: list[dict[str, Any]]) -> None:
+        exp = insert(TelegramUserToRoundModel)
+        exp = exp.on_conflict_do_update(
+            index_elements=[
+                TelegramUserToRoundModel.user_id,
+                TelegramUserToRoundModel.question_id,
+                TelegramUserToRoundModel.round_id,
+            ],
+            set_={"state": exp.excluded.state},
         )
-        return (await self.scalar(exp)).state == AnswerStatusEnum.ANSWERED
+        await self.execute(exp, rows)
 
-    async def get_question_by_id(self, question_id: int) -> QuestionModel:
+    async def generate_users_answer_status(
+        self,
+        game_id: int,
+        question_id: int,
+        round_id: int,
+    ) -> list[TelegramUserToRoundModel]:
+        # Повторный выбор того же вопроса ничего не вставит и вернёт пустой список
         exp = (
-            select(QuestionModel)
-            .where(QuestionModel.id == question_id)
+            insert(TelegramUserToRoundModel)
+            .from_select(
+                ["user_id", "question_id", "round_id", "state"],
+                select(
+                    TelegramUserToGameModel.user_id,
+                    literal(question_id),
+                    literal(round_id),
+                    literal(
+                        AnswerStatusEnum.NOT_ANSWERED,
+                        TelegramUserToRoundModel.state.type,
+                    ),
+                ).where(TelegramUserToGameModel.game_id == game_id),
+            )
+            .on_conflict_do_nothing()
+            .returning(TelegramUserToRoundModel)
         )
-        return await self.scalar(exp)
+        return list(await self.scalars(exp))
@@ -0,0 +1,87 @@
+import base64
+import binascii
+import secrets
+import struct
+from enum import IntEnum
+
+VERSION = 1
+TOKEN_FLAG = 0x80
+MAX_CALLBACK_DATA = 64
+
+
+class CallbackAction(IntEnum):
+    START_GAME = 1
+    CONNECT_TO_GAME = 2
+    ANSWERED = 3
+    CHOICE = 4
+    ANSWER = 5
+    CORRECT = 6
+    WRONG = 7
+
+
+_HEADER = struct.Struct(">BB")
+
+# Версия, действие и аргументы упаковываются одной заранее собранной структурой
+_SCHEMAS: dict[int, struct.Struct] = {
+    CallbackAction.START_GAME: struct.Struct(">BB"),
+    CallbackAction.CONNECT_TO_GAME: struct.Struct(">BB"),
+    CallbackAction.ANSWERED: struct.Struct(">BB"),
+    # round_id, question_id
+    CallbackAction.CHOICE: struct.Struct(">BBqq"),
+    CallbackAction.ANSWER: struct.Struct(">BBqq"),
+    # chat_id, user_id, game_id, message_id, question_id
+    CallbackAction.CORRECT: struct.Struct(">BBqqqiq"),
+    CallbackAction.WRONG: struct.Struct(">BBqqqiq"),
+}
+
+# Первый аргумент этих действий — игровой чат, хотя нажимают их в личке
+CHAT_ACTIONS = frozenset({CallbackAction.CORRECT, CallbackAction.WRONG})
+
+CallbackPayload = tuple[CallbackAction, tuple[int, ...]]
+
+
+def b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def b64decode(data: str) -> bytes | None:
+    try:
+        return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    except (binascii.Error, ValueError):
+        return None
+
+
+def pack(action: CallbackAction, *args: int) -> bytes:
+    return _SCHEMAS[action].pack(VERSION, action, *args)
+
+
+def unpack(raw: bytes) -> CallbackPayload | None:
+    if len(raw) < _HEADER.size or raw[0] != VERSION:
+        return None
+
+    schema = _SCHEMAS.get(raw[1])
+    if schema is None or schema.size != len(raw):
+        return None
+
+    _, action, *args = schema.unpack(raw)
+    return CallbackAction(action), tuple(args)
+
+
+def encode(action: CallbackAction, *args: int) -> str:
+    return b64encode(pack(action, *args))
+
+
+def new_token() -> str:
+    return b64encode(bytes([VERSION | TOKEN_FLAG]) + secrets.token_bytes(9))
+
+
+def is_token(raw: bytes) -> bool:
+    return bool(raw) and raw[0] == VERSION | TOKEN_FLAG
+
+
+def chat_affinity(data: str) -> int | None:
+    raw = b64decode(data)
+    payload = unpack(raw) if raw is not None else None
+    if payload is None or payload[0] not in CHAT_ACTIONS:
+        return None
+    return payload[1][0]
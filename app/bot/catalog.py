@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from aio_pika.abc import AbstractIncomingMessage
+
+from app.bot.models import QuestionModel, ThemeModel
+from app.core.manager import RabbitMQManager
+from app.core.metrics import metrics
+
+if TYPE_CHECKING:
+    from app.app import Application
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CatalogTheme:
+    id: int
+    title: str
+
+
+@dataclass(frozen=True)
+class CatalogQuestion:
+    id: int
+    theme_id: int
+    text: str
+    answer: str
+    hard_level: int
+
+
+# Темы и вопросы в памяти бота. Админка после каждой записи поднимает версию
+# каталога и рассылает id изменённых строк: подряд идущая версия дочитывается
+# точечно, пропуск версии — полная перезагрузка. Если рассылка потерялась,
+# расхождение версий найдёт периодическая сверка версии по базе
+class Catalog:
+    def __init__(self, app: "Application"):
+        self.app = app
+        self.version: int | None = None
+        self.themes: dict[int, CatalogTheme] = {}
+        self.questions: dict[int, CatalogQuestion] = {}
+        # theme_id -> id вопросов темы
+        self.theme_questions: dict[int, set[int]] = {}
+        self._listeners: list[Callable[[], None]] = []
+        self._lock = asyncio.Lock()
+
+    def on_change(self, listener: Callable[[], None]) -> None:
+        self._listeners.append(listener)
+
+    def _changed(self) -> None:
+        metrics.set("catalog_version", self.version or 0)
+        for listener in self._listeners:
+            listener()
+
+    async def start(self, rabbit: RabbitMQManager) -> None:
+        # Подписываемся до загрузки, чтобы не пропустить правки
+        exchange = self.app.config.rabbitmq.catalog_exchange
+        await rabbit.subscribe(exchange, self.on_message)
+        await self.reload()
+
+    async def reload(self) -> None:
+        async with self._lock:
+            await self._load()
+
+    async def poll(self) -> None:
+        accessor = self.app.accessors.theme_accessor
+        while True:
+            await asyncio.sleep(self.app.config.bot.catalog_poll_interval)
+            try:
+                version = await accessor.catalog_version()
+                if version == self.version:
+                    continue
+                async with self._lock:
+                    if version != self.version:
+                        logger.warning(
+                            "Каталог v%s отстал от базы (v%s), перечитываем целиком",
+                            self.version,
+                            version,
+                        )
+                        await self._load()
+            except Exception:
+                logger.exception("Не удалось сверить версию каталога")
+
+    async def _load(self) -> None:
+        accessor = self.app.accessors.theme_accessor
+        self.version = await accessor.catalog_version()
+        self.themes = {}
+        self.questions = {}
+        self.theme_questions = {}
+        self._put_themes(await accessor.get_themes())
+        self._put_questions(await accessor.get_all_questions())
+        self._changed()
+        logger.info(
+            "Каталог v%s: %d тем, %d вопросов",
+            self.version,
+            len(self.themes),
+            len(self.questions),
+        )
+
+    def _put_themes(self, themes: list[ThemeModel]) -> None:
+        for theme in themes:
+            self.themes[theme.id] = CatalogTheme(theme.id, theme.title)
+            self.theme_questions.setdefault(theme.id, set())
+
+    def _put_questions(self, questions: list[QuestionModel]) -> None:
+        for question in questions:
+            previous = self.questions.get(question.id)
+            if previous is not None:
+                self.theme_questions[previous.theme_id].discard(question.id)
+            self.questions[question.id] = CatalogQuestion(
+                question.id,
+                question.theme_id,
+                question.text,
+                question.answer,
+                question.hard_level,
+            )
+            self.theme_questions.setdefault(question.theme_id, set()).add(question.id)
+
+    async def on_message(self, msg: AbstractIncomingMessage) -> None:
+        change = json.loads(msg.body)
+        accessor = self.app.accessors.theme_accessor
+
+        async with self._lock:
+            version = change.get("version")
+            if (
+                self.version is not None
+                and version is not None
+                and version <= self.version
+            ):
+                return
+            if self.version is None or version is None or version != self.version + 1:
+                logger.warning(
+                    "Пропущены версии каталога %s..%s, перечитываем целиком",
+                    self.version,
+                    version,
+                )
+                await self._load()
+                return
+
+            self._put_themes(await accessor.get_themes(change["themes"]))
+            self._put_questions(await accessor.get_questions(change["questions"]))
+            self.version = version
+            self._changed()
+
+    def playable(self, hard_levels: int) -> dict[int, list[int]]:
+        # Играбельна тема, где есть вопрос на каждый уровень сложности
+        levels = set(range(1, hard_levels + 1))
+        playable = {}
+        for theme_id, question_ids in self.theme_questions.items():
+            if levels <= {self.questions[qid].hard_level for qid in question_ids}:
+                playable[theme_id] = sorted(question_ids)
+        return playable
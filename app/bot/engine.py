@@ -0,0 +1,423 @@
+import asyncio
+import copy
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from app.bot.catalog import Catalog
+from app.bot.freshness import FreshnessIndex
+from app.bot.models import (
+    AnswerStatusEnum,
+    GameModel,
+    GameStatusEnum,
+    QuestionToThemeModel,
+    RoundModel,
+)
+from app.bot.sampler import ThemeSampler
+from app.bot.schemas import Chat
+from app.core.metrics import metrics
+
+if TYPE_CHECKING:
+    from app.app import Application
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BoardCell:
+    theme_id: int
+    theme_title: str
+    question_id: int
+    text: str
+    answer: str
+    hard_level: int
+    status: AnswerStatusEnum
+
+
+@dataclass
+class GameState:
+    game_id: int
+    chat_id: int
+    master_id: int
+    status: GameStatusEnum
+    round_id: int
+    base_score: int
+    active_user_id: int | None
+    choice_user_id: int | None
+    # question_id -> ячейка, в порядке тем и сложности
+    board: dict[int, BoardCell] = field(default_factory=dict)
+    # user_id -> username
+    players: dict[int, str] = field(default_factory=dict)
+    scores: dict[int, int] = field(default_factory=dict)
+    # (question_id, user_id) -> состояние ответа
+    answers: dict[tuple[int, int], AnswerStatusEnum] = field(default_factory=dict)
+
+    # Что ещё не записано в базу
+    dirty_game: bool = False
+    dirty_scores: set[int] = field(default_factory=set)
+    dirty_questions: set[int] = field(default_factory=set)
+    dirty_answers: set[tuple[int, int]] = field(default_factory=set)
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(
+            self.dirty_game
+            or self.dirty_scores
+            or self.dirty_questions
+            or self.dirty_answers
+        )
+
+    def themes(self) -> list[list[BoardCell]]:
+        grouped: dict[int, list[BoardCell]] = {}
+        for cell in self.board.values():
+            grouped.setdefault(cell.theme_id, []).append(cell)
+        return list(grouped.values())
+
+    def has_questions(self) -> bool:
+        return any(
+            cell.status == AnswerStatusEnum.NOT_ANSWERED for cell in self.board.values()
+        )
+
+    def has_user_not_answered(self, question_id: int) -> bool:
+        return any(
+            state == AnswerStatusEnum.NOT_ANSWERED
+            for (qid, _), state in self.answers.items()
+            if qid == question_id
+        )
+
+    def pending_question(self, user_id: int) -> BoardCell | None:
+        for (question_id, answer_user_id), state in self.answers.items():
+            if answer_user_id == user_id and state == AnswerStatusEnum.WAIT_ANSWERED:
+                return self.board[question_id]
+        return None
+
+
+@dataclass
+class _Snapshot:
+    states: list[GameState]
+    games: list[dict[str, Any]]
+    scores: list[dict[str, Any]]
+    questions: list[dict[str, Any]]
+    answers: list[dict[str, Any]]
+
+
+# Состояние идущих игр в памяти воркера: решения принимаются по памяти,
+# изменения пачками пишутся в базу фоновым flush. Лобби и смена раундов идут
+# через базу напрямую. Работает, пока чат обслуживает ровно один воркер.
+# Состояние чата, чей обработчик ещё работает, flush пропускает
+class GameEngine:
+    def __init__(self, app: "Application"):
+        self.app = app
+        self._states: dict[int, GameState] = {}
+        self._busy: set[int] = set()
+        self._flush_lock = asyncio.Lock()
+        self.catalog = Catalog(app)
+        self.themes = ThemeSampler(app, self.catalog)
+        self.freshness = FreshnessIndex(app)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def checkpoint(self, chat_id: int) -> GameState | None:
+        # Копия до начала обработчика: при ошибке к ней и откатываемся
+        self._busy.add(chat_id)
+        return copy.deepcopy(self._states.get(chat_id))
+
+    def commit(self, chat_id: int) -> None:
+        self._busy.discard(chat_id)
+
+    def rollback(self, chat_id: int, checkpoint: GameState | None) -> None:
+        # Незаписанные правки прошлых обработчиков и их флаги dirty остались
+        # в копии, так что они не потеряются
+        if chat_id not in self._busy:
+            return
+        self._busy.discard(chat_id)
+        if checkpoint is None:
+            self._states.pop(chat_id, None)
+        else:
+            self._states[chat_id] = checkpoint
+
+    def peek(self, chat_id: int) -> GameState | None:
+        return self._states.get(chat_id)
+
+    async def get(self, chat_id: int) -> GameState | None:
+        state = self._states.get(chat_id)
+        if state is None:
+            state = await self._recover(chat_id)
+            if state is not None:
+                self._states[chat_id] = state
+        return state
+
+    async def _recover(self, chat_id: int) -> GameState | None:
+        accessor = self.app.accessors.game_accessor
+        chat = Chat(id=chat_id)
+
+        game = await accessor.get_active_game(chat)
+        if game is None or game.status == GameStatusEnum.LOBBY:
+            return None
+
+        round_ = await accessor.get_current_round(chat)
+        if round_ is None:
+            return None
+
+        state = await self._build(game, round_, await accessor.all_questions(chat))
+        for answer in await accessor.round_answers(round_.id):
+            state.answers[answer.question_id, answer.user_id] = answer.state
+        return state
+
+    async def _build(
+        self,
+        game: GameModel,
+        round_: RoundModel,
+        board: list[list[QuestionToThemeModel]],
+    ) -> GameState:
+        state = GameState(
+            game_id=game.id,
+            chat_id=game.chat_id,
+            master_id=game.master_id,
+            status=game.status,
+            round_id=round_.id,
+            base_score=round_.base_score,
+            active_user_id=game.active_user_id,
+            choice_user_id=game.choice_user_id,
+        )
+
+        # Тексты вопросов и названия тем берём из каталога, минуя базу.
+        # Вопрос мог появиться раньше, чем дошла рассылка про него
+        catalog = self.catalog
+        if any(qtt.question_id not in catalog.questions for g in board for qtt in g):
+            await catalog.reload()
+        for group in board:
+            cells = []
+            for qtt in group:
+                question = catalog.questions[qtt.question_id]
+                cells.append(
+                    BoardCell(
+                        theme_id=qtt.theme_id,
+                        theme_title=catalog.themes[qtt.theme_id].title,
+                        question_id=qtt.question_id,
+                        text=question.text,
+                        answer=question.answer,
+                        hard_level=question.hard_level,
+                        status=qtt.status,
+                    ),
+                )
+            for cell in sorted(cells, key=lambda x: x.hard_level):
+                state.board[cell.question_id] = cell
+
+        accessor = self.app.accessors.game_accessor
+        for profile in await accessor.all_profiles(game.id):
+            state.players[profile.user_id] = profile.user.username
+            state.scores[profile.user_id] = profile.score
+        return state
+
+    async def next_round(self, chat_id: int) -> GameState | None:
+        # Раунд создаётся в базе, поэтому сначала сбрасываем текущее состояние.
+        # Пишем в транзакции апдейта, чтобы при ошибке откатилось всё вместе
+        previous = self._states.pop(chat_id, None)
+        if previous is not None:
+            await self._write(self._snapshot([previous]))
+
+        accessor = self.app.accessors.game_accessor
+        chat = Chat(id=chat_id)
+        seen = await self.freshness.get(chat_id)
+        theme_ids = self.themes.sample(self.app.config.bot.themes_per_round, seen)
+        board = await accessor.next_round(chat, theme_ids)
+        if board is None:
+            return None
+
+        await self.freshness.add(
+            chat_id,
+            [qtt.question_id for group in board for qtt in group],
+        )
+
+        # Доску вернул сам INSERT раунда через RETURNING, отдельно её не читаем.
+        # Внутри апдейта игра и раунд приходят из кеша, их положил туда next_round
+        game = await accessor.get_active_game(chat)
+        round_ = await accessor.get_current_round(chat)
+        if game is None or round_ is None:
+            return None
+
+        state = await self._build(game, round_, board)
+        # Игра в кеше апдейта могла устареть относительно только что записанной
+        if previous is not None:
+            state.choice_user_id = previous.choice_user_id
+            state.active_user_id = previous.active_user_id
+        self._states[chat_id] = state
+        return state
+
+    def set_choice_user(self, state: GameState, user_id: int) -> None:
+        state.choice_user_id = user_id
+        state.dirty_game = True
+
+    def buzz_in(self, state: GameState, user_id: int, question_id: int) -> bool:
+        # Compare-and-set без await: апдейты чата идут по очереди, так что
+        # из одновременных нажатий отвечать будет только первое
+        if state.active_user_id is not None:
+            metrics.inc("buzz_in", result="lost")
+            return False
+
+        state.active_user_id = user_id
+        state.dirty_game = True
+        self._set_answer(state, question_id, user_id, AnswerStatusEnum.WAIT_ANSWERED)
+        metrics.inc("buzz_in", result="won")
+        return True
+
+    def set_active_user_null(self, state: GameState) -> None:
+        state.active_user_id = None
+        state.dirty_game = True
+
+    async def pick_question(self, state: GameState, question_id: int) -> None:
+        # Строки ответов создаются сразу одним запросом, память берёт их из RETURNING
+        created = await self.app.accessors.game_accessor.generate_users_answer_status(
+            state.game_id,
+            question_id,
+            state.round_id,
+        )
+        for answer in created:
+            state.answers.setdefault((question_id, answer.user_id), answer.state)
+
+    def mark_answered(self, state: GameState, user_id: int, question_id: int) -> None:
+        self._set_answer(state, question_id, user_id, AnswerStatusEnum.ANSWERED)
+        state.board[question_id].status = AnswerStatusEnum.ANSWERED
+        state.dirty_questions.add(question_id)
+
+    def add_score(self, state: GameState, user_id: int, score: int) -> None:
+        state.scores[user_id] = state.scores.get(user_id, 0) + score
+        state.dirty_scores.add(user_id)
+
+    @staticmethod
+    def _set_answer(
+        state: GameState,
+        question_id: int,
+        user_id: int,
+        answer_state: AnswerStatusEnum,
+    ) -> None:
+        state.answers[question_id, user_id] = answer_state
+        state.dirty_answers.add((question_id, user_id))
+
+    def _snapshot(self, states: list[GameState]) -> _Snapshot:
+        # Забираем изменения без await, чтобы не потерять параллельные правки
+        snapshot = _Snapshot(states=[], games=[], scores=[], questions=[], answers=[])
+        for state in states:
+            if not state.is_dirty:
+                continue
+            snapshot.states.append(state)
+
+            if state.dirty_game:
+                snapshot.games.append(
+                    {
+                        "id": state.game_id,
+                        "active_user_id": state.active_user_id,
+                        "choice_user_id": state.choice_user_id,
+                    },
+                )
+            snapshot.scores.extend(
+                {"user_id": user_id, "game_id": state.game_id, "score": score}
+                for user_id in state.dirty_scores
+                if (score := state.scores.get(user_id)) is not None
+            )
+            snapshot.questions.extend(
+                {
+                    "round_id": state.round_id,
+                    "theme_id": state.board[question_id].theme_id,
+                    "question_id": question_id,
+                    "status": state.board[question_id].status,
+                }
+                for question_id in state.dirty_questions
+            )
+            snapshot.answers.extend(
+                {
+                    "user_id": user_id,
+                    "question_id": question_id,
+                    "round_id": state.round_id,
+                    "state": state.answers[question_id, user_id],
+                }
+                for question_id, user_id in state.dirty_answers
+            )
+
+            state.dirty_game = False
+            state.dirty_scores = set()
+            state.dirty_questions = set()
+            state.dirty_answers = set()
+        return snapshot
+
+    @staticmethod
+    def _restore(snapshot: _Snapshot) -> None:
+        games = {row["id"] for row in snapshot.games}
+        for state in snapshot.states:
+            state.dirty_game |= state.game_id in games
+            state.dirty_scores |= {
+                row["user_id"]
+                for row in snapshot.scores
+                if row["game_id"] == state.game_id
+            }
+            state.dirty_questions |= {
+                row["question_id"]
+                for row in snapshot.questions
+                if row["round_id"] == state.round_id
+            }
+            state.dirty_answers |= {
+                (row["question_id"], row["user_id"])
+                for row in snapshot.answers
+                if row["round_id"] == state.round_id
+            }
+
+    async def _write(self, snapshot: _Snapshot) -> None:
+        accessor = self.app.accessors.game_accessor
+        if snapshot.games:
+            await accessor.bulk_update_games(snapshot.games)
+        if snapshot.scores:
+            await accessor.bulk_update_scores(snapshot.scores)
+        if snapshot.questions:
+            await accessor.bulk_update_questions(snapshot.questions)
+        if snapshot.answers:
+            await accessor.upsert_answers(snapshot.answers)
+
+    async def flush(self, states: list[GameState] | None = None) -> None:
+        async with self._flush_lock:
+            if states is None:
+                states = [
+                    state
+                    for chat_id, state in self._states.items()
+                    if chat_id not in self._busy
+                ]
+            snapshot = self._snapshot(states)
+            if not snapshot.states:
+                return
+
+            accessor = self.app.accessors.game_accessor
+            # Отдельная сессия: запись не должна зависеть от транзакции апдейта.
+            # Отмена посреди записи тоже возвращает флаги dirty
+            try:
+                async with accessor.session() as session, session.begin():
+                    await self._write(snapshot)
+            except BaseException:
+                self._restore(snapshot)
+                raise
+
+    async def evict(self, chat_id: int) -> None:
+        state = self._states.get(chat_id)
+        if state is None:
+            return
+        await self.flush([state])
+        self._states.pop(chat_id, None)
+
+    async def evict_where(self, predicate: Callable[[int], bool]) -> None:
+        # Выгружаем состояние в любом случае: записывать позже уже нельзя,
+        # чат к этому времени может обслуживать другой воркер
+        for chat_id in [chat_id for chat_id in self._states if predicate(chat_id)]:
+            try:
+                await self.evict(chat_id)
+            except Exception:
+                logger.exception("Не удалось сохранить состояние чата %s", chat_id)
+            self._states.pop(chat_id, None)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.app.config.bot.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось сохранить состояние игр")
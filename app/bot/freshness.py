@@ -0,0 +1,170 @@
+import struct
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.app import Application
+
+
+# Версия формата в первом байте
+_FORMAT = 1
+_CHUNK_HEADER = struct.Struct("<HBH")
+_ARRAY, _BITMAP = 0, 1
+# Дальше массив из uint16 занимает больше, чем битмап чанка на 8 КБ
+_ARRAY_LIMIT = 4096
+_BITMAP_SIZE = 1 << 13
+
+
+def _bitmap_has(bits: bytes | bytearray, low: int) -> bool:
+    return bool(bits[low >> 3] >> (low & 7) & 1)
+
+
+# Множество id в духе roaring bitmap: id делятся на чанки по старшим 16 битам.
+# Чанк хранит отсортированный массив младших 16 бит id, плотный чанк — битмап.
+# Размер зависит от числа увиденных вопросов, но не от максимального id
+class CompactIdSet:
+    def __init__(self) -> None:
+        self._chunks: dict[int, array[int] | bytearray] = {}
+
+    def __contains__(self, value: int) -> bool:
+        chunk = self._chunks.get(value >> 16)
+        if chunk is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(chunk, bytearray):
+            return _bitmap_has(chunk, low)
+        index = bisect_left(chunk, low)
+        return index < len(chunk) and chunk[index] == low
+
+    def add(self, value: int) -> None:
+        high, low = value >> 16, value & 0xFFFF
+        chunk = self._chunks.setdefault(high, array("H"))
+        if isinstance(chunk, bytearray):
+            chunk[low >> 3] |= 1 << (low & 7)
+            return
+
+        index = bisect_left(chunk, low)
+        if index < len(chunk) and chunk[index] == low:
+            return
+        chunk.insert(index, low)
+        if len(chunk) > _ARRAY_LIMIT:
+            bits = bytearray(_BITMAP_SIZE)
+            for item in chunk:
+                bits[item >> 3] |= 1 << (item & 7)
+            self._chunks[high] = bits
+
+    def to_bytes(self) -> bytes:
+        if not self._chunks:
+            return b""
+        parts = [bytes([_FORMAT])]
+        for high, chunk in sorted(self._chunks.items()):
+            if isinstance(chunk, bytearray):
+                parts.extend((_CHUNK_HEADER.pack(high, _BITMAP, 0), bytes(chunk)))
+            else:
+                parts.extend(
+                    (
+                        _CHUNK_HEADER.pack(high, _ARRAY, len(chunk)),
+                        struct.pack(f"<{len(chunk)}H", *chunk),
+                    ),
+                )
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CompactIdSet":
+        result = cls()
+        if not data:
+            return result
+        if data[0] != _FORMAT:
+            raise ValueError(f"Unknown CompactIdSet format: {data[0]}")
+
+        offset = 1
+        while offset < len(data):
+            high, kind, count = _CHUNK_HEADER.unpack_from(data, offset)
+            offset += _CHUNK_HEADER.size
+            if kind == _BITMAP:
+                result._chunks[high] = bytearray(data[offset : offset + _BITMAP_SIZE])
+                offset += _BITMAP_SIZE
+            else:
+                result._chunks[high] = array(
+                    "H",
+                    struct.unpack_from(f"<{count}H", data, offset),
+                )
+                offset += count * 2
+        return result
+
+
+# Увиденные вопросы в двух поколениях: при устаревании текущее поколение
+# становится прошлым, прошлое забывается. Вопрос помнится от decay до 2*decay
+@dataclass
+class SeenQuestions:
+    current: CompactIdSet = field(default_factory=CompactIdSet)
+    previous: CompactIdSet = field(default_factory=CompactIdSet)
+    epoch_at: datetime = field(default_factory=datetime.utcnow)
+
+    def rotate(self, decay: timedelta) -> None:
+        age = datetime.utcnow() - self.epoch_at
+        if age < decay:
+            return
+        self.previous = self.current if age < 2 * decay else CompactIdSet()
+        self.current = CompactIdSet()
+        self.epoch_at = datetime.utcnow()
+
+    def is_seen(self, question_ids: Iterable[int]) -> bool:
+        return any(
+            qid in self.current or qid in self.previous for qid in question_ids
+        )
+
+    def add(self, question_ids: Iterable[int]) -> None:
+        for qid in question_ids:
+            self.current.add(qid)
+
+
+class FreshnessIndex:
+    def __init__(self, app: "Application"):
+        self.app = app
+        # Недавние чаты, остальные поднимаются из базы по требованию
+        self._chats: OrderedDict[int, SeenQuestions] = OrderedDict()
+
+    @property
+    def decay(self) -> timedelta:
+        return timedelta(seconds=self.app.config.bot.seen_decay)
+
+    async def get(self, chat_id: int) -> SeenQuestions:
+        seen = self._chats.get(chat_id)
+        if seen is None:
+            history = await self.app.accessors.history_accessor.get(chat_id)
+            seen = (
+                SeenQuestions()
+                if history is None
+                else SeenQuestions(
+                    current=CompactIdSet.from_bytes(history.current),
+                    previous=CompactIdSet.from_bytes(history.previous),
+                    epoch_at=history.epoch_at,
+                )
+            )
+            self._chats[chat_id] = seen
+            if len(self._chats) > self.app.config.bot.seen_cache_size:
+                self._chats.popitem(last=False)
+        self._chats.move_to_end(chat_id)
+
+        seen.rotate(self.decay)
+        return seen
+
+    async def add(self, chat_id: int, question_ids: Iterable[int]) -> None:
+        seen = await self.get(chat_id)
+        seen.add(question_ids)
+        await self.app.accessors.history_accessor.save(
+            chat_id,
+            seen.current.to_bytes(),
+            seen.previous.to_bytes(),
+            seen.epoch_at,
+        )
+
+    def forget_where(self, predicate: Callable[[int], bool]) -> None:
+        for chat_id in [chat_id for chat_id in self._chats if predicate(chat_id)]:
+            del self._chats[chat_id]
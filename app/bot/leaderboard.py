@@ -0,0 +1,237 @@
+import json
+import logging
+import math
+import random
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from aio_pika.abc import AbstractIncomingMessage
+
+from app.core.manager import RabbitMQManager
+from app.core.metrics import metrics
+
+if TYPE_CHECKING:
+    from app.app import Application
+
+logger = logging.getLogger(__name__)
+
+Key = tuple[int, int]
+
+
+class _Inf:
+    # Ключ хвостового узла: больше любого ключа списка
+    def __lt__(self, other: Any) -> bool:
+        return False
+
+    def __le__(self, other: Any) -> bool:
+        return other is self
+
+    def __gt__(self, other: Any) -> bool:
+        return other is not self
+
+    def __ge__(self, other: Any) -> bool:
+        return True
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key: Any, levels: int):
+        self.key = key
+        self.next: list[_Node] = []
+        self.width: list[int] = [1] * levels
+
+
+_NIL = _Node(_Inf(), 0)
+
+
+# Skiplist, где каждая ссылка хранит, сколько элементов она перепрыгивает.
+# Вставка, удаление, позиция ключа и элемент по индексу работают за O(log n)
+class IndexableSkiplist:
+    MAX_LEVELS = 32
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self._head = _Node(None, self.MAX_LEVELS)
+        self._head.next = [_NIL] * self.MAX_LEVELS
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def insert(self, key: Key) -> None:
+        chain: list[_Node] = [self._head] * self.MAX_LEVELS
+        steps_at_level = [0] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = min(self.MAX_LEVELS, 1 - int(math.log(1 - random.random(), 2.0)))
+        new = _Node(key, levels)
+        new.next = [_NIL] * levels
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key: Key) -> None:
+        chain: list[_Node] = [self._head] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target.key != key:
+            raise KeyError(key)
+
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def index(self, key: Key) -> int:
+        position = 0
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        if node.next[0].key != key:
+            raise KeyError(key)
+        return position
+
+    def iter_from(self, index: int) -> Iterator[Key]:
+        if index < 0 or index >= self._size:
+            return
+        distance = index + 1
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.width[level] <= distance:
+                distance -= node.width[level]
+                node = node.next[level]
+        while node is not _NIL:
+            yield node.key
+            node = node.next[0]
+
+
+@dataclass
+class LeaderboardEntry:
+    rank: int
+    user_id: int
+    username: str
+    score: int
+
+
+# Общий рейтинг в памяти. Ключ (-score, user_id): выше очки — раньше в списке,
+# при равенстве порядок стабилен по id
+class Leaderboard:
+    def __init__(self) -> None:
+        self._ranking = IndexableSkiplist()
+        self._users: dict[int, tuple[int, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def clear(self) -> None:
+        self._ranking.clear()
+        self._users.clear()
+
+    def update(self, user_id: int, username: str, score: int) -> None:
+        previous = self._users.get(user_id)
+        if previous is not None:
+            if previous[0] == score:
+                self._users[user_id] = (score, username)
+                return
+            self._ranking.remove((-previous[0], user_id))
+        self._ranking.insert((-score, user_id))
+        self._users[user_id] = (score, username)
+
+    def _entry(self, rank: int, user_id: int) -> LeaderboardEntry:
+        score, username = self._users[user_id]
+        return LeaderboardEntry(rank, user_id, username, score)
+
+    def top(self, limit: int, offset: int = 0) -> list[LeaderboardEntry]:
+        entries: list[LeaderboardEntry] = []
+        for rank, (_, user_id) in enumerate(
+            self._ranking.iter_from(offset),
+            start=offset + 1,
+        ):
+            if len(entries) == limit:
+                break
+            entries.append(self._entry(rank, user_id))
+        return entries
+
+    def rank(self, user_id: int) -> LeaderboardEntry | None:
+        previous = self._users.get(user_id)
+        if previous is None:
+            return None
+        return self._entry(self._ranking.index((-previous[0], user_id)) + 1, user_id)
+
+
+# Связывает рейтинг процесса, базу и остальные процессы: холодный старт
+# одним потоковым проходом по telegram_user, дальше — изменения через fanout.
+# Пока идёт проход, изменения копятся в буфере и применяются после него, иначе
+# clear() и устаревшие строки прохода затёрли бы более свежие очки
+class LeaderboardFeed:
+    def __init__(self, app: "Application", leaderboard: Leaderboard):
+        self.app = app
+        self.leaderboard = leaderboard
+        self.rabbit: RabbitMQManager | None = None
+        self._pending: list[tuple[int, str, int]] | None = None
+
+    @property
+    def exchange(self) -> str:
+        return self.app.config.rabbitmq.leaderboard_exchange
+
+    async def start(self, rabbit: RabbitMQManager) -> None:
+        # Подписываемся до прохода по базе, чтобы не пропустить изменения
+        self.rabbit = rabbit
+        await rabbit.subscribe(self.exchange, self.on_message)
+        await self.rebuild()
+
+    async def rebuild(self) -> None:
+        self._pending = []
+        try:
+            self.leaderboard.clear()
+            scores = self.app.accessors.user_accessor.stream_scores()
+            async for user_id, username, score in scores:
+                self.leaderboard.update(user_id, username, score)
+            for user_id, username, score in self._pending:
+                self.leaderboard.update(user_id, username, score)
+        finally:
+            self._pending = None
+        metrics.set("leaderboard_size", len(self.leaderboard))
+        logger.info("Рейтинг собран: %d игроков", len(self.leaderboard))
+
+    async def publish(self, rows: list[tuple[int, str, int]]) -> None:
+        if self.rabbit is None:
+            raise RuntimeError("LeaderboardFeed is not started")
+        body = json.dumps(rows).encode()
+        await self.rabbit.publish(self.exchange, body)
+
+    async def on_message(self, msg: AbstractIncomingMessage) -> None:
+        rows = [tuple(row) for row in json.loads(msg.body)]
+        if self._pending is not None:
+            self._pending.extend(rows)
+            return
+        for user_id, username, score in rows:
+            self.leaderboard.update(user_id, username, score)
+        metrics.set("leaderboard_size", len(self.leaderboard))
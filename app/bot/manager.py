@@ -1,17 +1,37 @@
 import asyncio
 import json
+import logging
 from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
 from typing import TYPE_CHECKING, Any, Literal
 
 import aiohttp
 from aio_pika.abc import AbstractIncomingMessage
 
-from app.bot.schemas import CallbackQuery, Chat, Message, TelegramUpdate
+from app.bot import callback
+from app.bot.callback import CallbackAction, CallbackPayload
+from app.bot.engine import GameEngine
+from app.bot.leaderboard import Leaderboard, LeaderboardFeed
+from app.bot.router import CallbackHandler, MessageHandler, Router
+from app.bot.scheduler import ChatScheduler
+from app.bot.schemas import CallbackQuery, Chat, TelegramUpdate
+from app.bot.sharding import (
+    SHARD_QUEUE_ARGUMENTS,
+    ShardBalancer,
+    declare_shard_queues,
+    shard_for,
+    update_chat_id,
+)
+from app.core.accessor import transaction
+from app.core.lanes import OutputLane, lane_for_method
 from app.core.manager import RabbitMQManager
+from app.core.metrics import metrics, report_metrics
 
 if TYPE_CHECKING:
     from app.app import Application
 
+logger = logging.getLogger(__name__)
+
 
 class TelegramBotManager:
     def __init__(self, app: "Application"):
@@ -19,13 +39,22 @@ class TelegramBotManager:
         self._token = app.config.bot.token
         self._base_url = "https://api.telegram.org/bot"
         self._session: aiohttp.ClientSession | None = None
-        self._handlers: list[
-            tuple[list[str] | None, Callable[[Message], Awaitable[None]]]
-        ] = []
-        self._callback_handlers: list[
-            tuple[str | None, Callable[[CallbackQuery], Awaitable[None]]]
-        ] = []
+        self.router = Router(app.config.bot.username)
         self.rabbit_output: RabbitMQManager | None = None
+        self._outbox: ContextVar[list[tuple[OutputLane, bytes]] | None] = ContextVar(
+            "outbox",
+            default=None,
+        )
+        self._after_commit: ContextVar[list[Callable[[], Awaitable[None]]] | None] = (
+            ContextVar("after_commit", default=None)
+        )
+        self.engine = GameEngine(app)
+        self.leaderboard = Leaderboard()
+        self.leaderboard_feed = LeaderboardFeed(app, self.leaderboard)
+        self.scheduler = ChatScheduler(
+            concurrency=app.config.bot.concurrency,
+            idle_timeout=app.config.bot.actor_idle_timeout,
+        )
 
     def build_method_url(self, method_name: str) -> str:
         return f"{self._base_url}{self._token}/{method_name}"
@@ -34,7 +63,9 @@ class TelegramBotManager:
         await self.connect()
         rabbit_input = RabbitMQManager(
             amqp_url=self.app.config.rabbitmq.url,
-            queue_name=self.app.config.rabbitmq.input_queue,
+            queue_name=self.app.config.rabbitmq.input_shard_queue(0),
+            arguments=SHARD_QUEUE_ARGUMENTS,
+            prefetch_count=self.app.config.bot.prefetch_count,
         )
         self.rabbit_output = RabbitMQManager(
             amqp_url=self.app.config.rabbitmq.url,
@@ -43,10 +74,59 @@ class TelegramBotManager:
 
         await rabbit_input.connect()
         await self.rabbit_output.connect()
-
-        await rabbit_input.consume(self.get_update)
-
-        await asyncio.Event().wait()
+        for lane in OutputLane:
+            await self.rabbit_output.declare(
+                self.app.config.rabbitmq.output_lane_queue(lane),
+            )
+        await declare_shard_queues(rabbit_input, self.app.config.rabbitmq)
+        await self.leaderboard_feed.start(self.rabbit_output)
+        await self.engine.catalog.start(self.rabbit_output)
+
+        reporter = asyncio.create_task(
+            report_metrics(logger, self.app.config.bot.metrics_interval),
+        )
+        flusher = asyncio.create_task(self.engine.run())
+        cleaner = asyncio.create_task(self.clean_callback_tokens())
+        catalog_poller = asyncio.create_task(self.engine.catalog.poll())
+        balancer = ShardBalancer(
+            self.app,
+            rabbit_input,
+            self.get_update,
+            on_release=self.release_shard,
+        )
+        try:
+            await balancer.run()
+        finally:
+            reporter.cancel()
+            flusher.cancel()
+            cleaner.cancel()
+            catalog_poller.cancel()
+            # Каждый шард отдаётся через release_shard, он же сохраняет игры
+            await balancer.stop()
+
+    async def clean_callback_tokens(self) -> None:
+        # Удаление идемпотентно, так что запуск на каждом воркере не мешает
+        accessor = self.app.accessors.callback_token_accessor
+        while True:
+            try:
+                deleted = await accessor.delete_expired(
+                    self.app.config.bot.callback_token_ttl,
+                )
+            except Exception:
+                logger.exception("Не удалось удалить старые токены кнопок")
+            else:
+                metrics.inc("callback_tokens_deleted", deleted)
+            await asyncio.sleep(self.app.config.bot.cleanup_interval)
+
+    async def release_shard(self, shard: int) -> None:
+        # Чаты шарда переходят к другому воркеру, он поднимет их из базы
+        shards = self.app.config.rabbitmq.input_shards
+
+        def owned(chat_id: int) -> bool:
+            return shard_for(chat_id, shards) == shard
+
+        await self.engine.evict_where(owned)
+        self.engine.freshness.forget_where(owned)
 
     def mainloop(self) -> None:
         asyncio.run(self._mainloop())
@@ -64,69 +144,147 @@ class TelegramBotManager:
         if self.rabbit_output is None:
             raise RuntimeError("RabitMQ is not connected")
 
-        await self.rabbit_output.send(
-            json.dumps(
-                {
-                    "method": self.build_method_url(method),
-                    "data": json_,
-                },
-            ).encode()
-        )
+        body = json.dumps(
+            {
+                "method": self.build_method_url(method),
+                "data": json_,
+            },
+        ).encode()
+
+        # Внутри обработки апдейта отправляем только после коммита
+        lane = lane_for_method(method)
+        outbox = self._outbox.get()
+        if outbox is not None:
+            outbox.append((lane, body))
+        else:
+            await self.rabbit_output.send(
+                body,
+                self.app.config.rabbitmq.output_lane_queue(lane),
+            )
 
     async def get_update(self, msg: AbstractIncomingMessage) -> None:
-        async with msg.process():
-            data = json.loads(msg.body)
-            update = TelegramUpdate(**data)
-
-            if update.message and update.message.text:
-                text = update.message.text.strip()
-                is_command = text.startswith("/")
-
-                for commands, handler in self._handlers:
-                    if commands is None and not is_command:
-                        await handler(update.message)
-                    elif (
-                        commands is not None
-                        and is_command
-                        and any(
-                            text.split()[0] == f"/{command}" for command in commands
-                        )
-                    ):
-                        await handler(update.message)
-                        return
-
-            elif update.callback_query and update.callback_query.data:
-                data = update.callback_query.data
-                for expected_data, handler in self._callback_handlers:
-                    if expected_data is None or data == expected_data:
-                        await handler(update.callback_query)
-                        return
+        # Ставим в очередь чата до первого await, чтобы не нарушить порядок
+        data = json.loads(msg.body)
+
+        chat_id = update_chat_id(data)
+
+        async def job() -> None:
+            async with msg.process():
+                checkpoint = None
+                if chat_id is not None:
+                    checkpoint = self.engine.checkpoint(chat_id)
+                try:
+                    await self.handle(TelegramUpdate(**data), chat_id)
+                except Exception:
+                    # Память откатывается так же, как транзакция апдейта.
+                    # Если транзакция уже закоммичена, откатывать нечего
+                    if chat_id is not None:
+                        self.engine.rollback(chat_id, checkpoint)
+                    raise
+
+        await self.scheduler.run(chat_id, job)
+
+    async def handle(self, update: TelegramUpdate, chat_id: int | None = None) -> None:
+        # Одна сессия и одна транзакция на апдейт, при ошибке всё откатится
+        # и исходящие сообщения не уйдут
+        if self.rabbit_output is None:
+            raise RuntimeError("RabitMQ is not connected")
+
+        outbox: list[tuple[OutputLane, bytes]] = []
+        hooks: list[Callable[[], Awaitable[None]]] = []
+        token = self._outbox.set(outbox)
+        hooks_token = self._after_commit.set(hooks)
+        base_accessor = self.app.accessors.base_accessor
+        try:
+            with base_accessor.identity_map():
+                async with transaction(base_accessor):
+                    await self.dispatch(update)
+            if chat_id is not None:
+                self.engine.commit(chat_id)
+        finally:
+            self._outbox.reset(token)
+            self._after_commit.reset(hooks_token)
+
+        # Полосы публикуются по приоритету, внутри полосы порядок сохраняется
+        for lane in OutputLane:
+            bodies = [body for body_lane, body in outbox if body_lane == lane]
+            if bodies:
+                await self.rabbit_output.send_many(
+                    bodies,
+                    self.app.config.rabbitmq.output_lane_queue(lane),
+                )
+        for hook in hooks:
+            await hook()
+
+    async def after_commit(self, hook: Callable[[], Awaitable[None]]) -> None:
+        # Вне обработки апдейта транзакции нет, выполняем сразу
+        hooks = self._after_commit.get()
+        if hooks is None:
+            await hook()
+        else:
+            hooks.append(hook)
+
+    async def dispatch(self, update: TelegramUpdate) -> None:
+        if update.message and update.message.text:
+            text = update.message.text.strip()
+
+            if not text.startswith("/"):
+                for handler in self.router.text_handlers():
+                    await handler(update.message, [])
+            elif (resolved := self.router.resolve_command(text)) is not None:
+                handler, args = resolved
+                await handler(update.message, args)
+
+        elif update.callback_query and update.callback_query.data:
+            data = update.callback_query.data
+            payload = await self.decode_callback(data)
+            resolved_callback = (
+                self.router.resolve_action(payload)
+                if payload is not None
+                else self.router.resolve_callback(data)
+            )
+            if resolved_callback is not None:
+                callback_handler, callback_args = resolved_callback
+                await callback_handler(update.callback_query, callback_args)
 
     def connect_handler(
         self, commands: list[str] | None = None
-    ) -> Callable[
-        [Callable[[Message], Awaitable[None]]],
-        Callable[[Message], Awaitable[None]],
-    ]:
-        def decorator(
-            func: Callable[[Message], Awaitable[None]],
-        ) -> Callable[[Message], Awaitable[None]]:
-            self._handlers.append((commands, func))
+    ) -> Callable[[MessageHandler], MessageHandler]:
+        def decorator(func: MessageHandler) -> MessageHandler:
+            self.router.add_message_handler(commands, func)
             return func
 
         return decorator
 
+    async def callback_data(self, action: CallbackAction, *args: int) -> str:
+        data = callback.encode(action, *args)
+        if len(data) <= callback.MAX_CALLBACK_DATA:
+            return data
+
+        # Данные длиннее лимита Telegram: кладём их в базу, в кнопку идёт только токен
+        return await self.app.accessors.callback_token_accessor.create(
+            callback.new_token(),
+            callback.pack(action, *args),
+        )
+
+    async def decode_callback(self, data: str) -> CallbackPayload | None:
+        raw = callback.b64decode(data)
+        if raw is None:
+            return None
+
+        if callback.is_token(raw):
+            raw = await self.app.accessors.callback_token_accessor.get(data)
+            if raw is None:
+                return None
+
+        return callback.unpack(raw)
+
     def connect_callback_handler(
         self,
-        data_value: str | None = None,
-    ) -> Callable[
-        [Callable[[CallbackQuery], Awaitable[None]]],
-        Callable[[CallbackQuery], Awaitable[None]],
-    ]:
-        def decorator(
-            func: Callable[[CallbackQuery], Awaitable[None]],
-        ) -> Callable[[CallbackQuery], Awaitable[None]]:
-            self._callback_handlers.append((data_value, func))
+        data_value: CallbackAction | str | None = None,
+    ) -> Callable[[CallbackHandler], CallbackHandler]:
+        def decorator(func: CallbackHandler) -> CallbackHandler:
+            self.router.add_callback_handler(data_value, func)
             return func
 
         return decorator
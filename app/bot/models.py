@@ -7,10 +7,13 @@ from sqlalchemy import (
     CheckConstraint,
     Enum as PgEnum,
     ForeignKey,
+    Index,
     Interval,
+    LargeBinary,
     PrimaryKeyConstraint,
     SmallInteger,
     String,
+    text,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -44,6 +47,7 @@ class TelegramUserModel(BaseModel):
     __table_args__ = (
         CheckConstraint("win_count >= 0", name="win_count_non_negative"),
         CheckConstraint("loss_count >= 0", name="loss_count_non_negative"),
+        Index("ix_telegram_user_score_id", "score", "id"),
     )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
@@ -55,6 +59,14 @@ class TelegramUserModel(BaseModel):
 
 class GameModel(IDMixin, BaseModel):
     __tablename__ = "game"
+    __table_args__ = (
+        # Завершённых игр большинство, индекс держим только по активным
+        Index(
+            "ix_game_chat_id_active",
+            "chat_id",
+            postgresql_where=text("status != 'COMPLETED'"),
+        ),
+    )
 
     chat_id: Mapped[int] = mapped_column(BigInteger)
     status: Mapped[GameStatusEnum] = mapped_column(
@@ -74,6 +86,7 @@ class GameModel(IDMixin, BaseModel):
 
 class TelegramUserToGameModel(BaseModel):
     __tablename__ = "telegram_user_to_game"
+    __table_args__ = (Index("ix_telegram_user_to_game_game_id", "game_id"),)
 
     user_id: Mapped[int] = mapped_column(
         ForeignKey("telegram_user.id"),
@@ -112,6 +125,9 @@ class ThemeModel(IDMixin, BaseModel):
 
 class QuestionModel(IDMixin, BaseModel):
     __tablename__ = "question"
+    __table_args__ = (
+        Index("ix_question_theme_id_hard_level", "theme_id", "hard_level"),
+    )
 
     text: Mapped[str] = mapped_column(String(255))
     answer: Mapped[str] = mapped_column(String(255))
@@ -132,6 +148,7 @@ class QuestionToThemeModel(BaseModel):
             "question_id",
             name="pk_question_to_theme",
         ),
+        Index("ix_question_to_theme_round_id_status", "round_id", "status"),
     )
 
     round_id: Mapped[int] = mapped_column(ForeignKey("round.id"))
@@ -148,6 +165,7 @@ class QuestionToThemeModel(BaseModel):
 
 class RoundToGameModel(BaseModel):
     __tablename__ = "round_to_game"
+    __table_args__ = (Index("ix_round_to_game_game_id", "game_id"),)
 
     round_id: Mapped[int] = mapped_column(ForeignKey("round.id"), primary_key=True)
     game_id: Mapped[int] = mapped_column(ForeignKey("game.id"), primary_key=True)
@@ -162,6 +180,14 @@ class ThemeToRoundModel(BaseModel):
 
 class TelegramUserToRoundModel(BaseModel):
     __tablename__ = "telegram_user_to_round"
+    __table_args__ = (
+        Index(
+            "ix_telegram_user_to_round_round_id_question_id_state",
+            "round_id",
+            "question_id",
+            "state",
+        ),
+    )
 
     user_id: Mapped[int] = mapped_column(
         ForeignKey("telegram_user.id"),
@@ -187,3 +213,38 @@ class TimersModel(BaseModel):
     create_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=datetime.utcnow)
     question_id: Mapped[int] = mapped_column(ForeignKey("question.id"))
     duration: Mapped[timedelta] = mapped_column(Interval)
+
+
+class BotWorkerModel(BaseModel):
+    __tablename__ = "bot_worker"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    heartbeat_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=datetime.utcnow)
+
+
+class CallbackTokenModel(BaseModel):
+    __tablename__ = "callback_token"
+
+    token: Mapped[str] = mapped_column(String(16), primary_key=True)
+    payload: Mapped[bytes] = mapped_column(LargeBinary)
+    create_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=datetime.utcnow)
+
+
+class ChatHistoryModel(BaseModel):
+    __tablename__ = "chat_history"
+
+    chat_id: Mapped[int] = mapped_column(
+        BigInteger,
+        primary_key=True,
+        autoincrement=False,
+    )
+    current: Mapped[bytes] = mapped_column(LargeBinary)
+    previous: Mapped[bytes] = mapped_column(LargeBinary)
+    epoch_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=datetime.utcnow)
+
+
+class CatalogVersionModel(BaseModel):
+    __tablename__ = "catalog_version"
+
+    id: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0)
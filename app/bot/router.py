@@ -0,0 +1,102 @@
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from app.bot.callback import CallbackAction, CallbackPayload
+from app.bot.schemas import CallbackQuery, Message
+
+MessageHandler = Callable[[Message, list[str]], Awaitable[None]]
+CallbackHandler = Callable[[CallbackQuery, tuple[int, ...]], Awaitable[None]]
+
+
+@dataclass
+class _CallbackNode:
+    children: dict[str, "_CallbackNode"] = field(default_factory=dict)
+    handler: CallbackHandler | None = None
+
+
+class Router:
+    def __init__(self, bot_username: str | None = None):
+        self._bot_username = bot_username.lower() if bot_username else None
+        self._commands: dict[str, MessageHandler] = {}
+        self._text_handlers: list[MessageHandler] = []
+        self._actions: dict[CallbackAction, CallbackHandler] = {}
+        self._callbacks = _CallbackNode()
+
+    def add_message_handler(
+        self,
+        commands: list[str] | None,
+        handler: MessageHandler,
+    ) -> None:
+        if commands is None:
+            self._text_handlers.append(handler)
+            return
+
+        for command in commands:
+            self._commands.setdefault(command.lower(), handler)
+
+    def add_callback_handler(
+        self,
+        prefix: CallbackAction | str | None,
+        handler: CallbackHandler,
+    ) -> None:
+        if isinstance(prefix, CallbackAction):
+            self._actions.setdefault(prefix, handler)
+            return
+
+        node = self._callbacks
+        for part in prefix.split(":") if prefix else []:
+            node = node.children.setdefault(part, _CallbackNode())
+
+        if node.handler is None:
+            node.handler = handler
+
+    def resolve_command(self, text: str) -> tuple[MessageHandler, list[str]] | None:
+        head, *args = text.split()
+        command, _, username = head[1:].partition("@")
+
+        # Команда адресована другому боту в группе
+        if username and self._bot_username and username.lower() != self._bot_username:
+            return None
+
+        handler = self._commands.get(command.lower())
+        if handler is None:
+            return None
+        return handler, args
+
+    def text_handlers(self) -> list[MessageHandler]:
+        return self._text_handlers
+
+    def resolve_action(
+        self,
+        payload: CallbackPayload,
+    ) -> tuple[CallbackHandler, tuple[int, ...]] | None:
+        action, args = payload
+        handler = self._actions.get(action)
+        if handler is None:
+            return None
+        return handler, args
+
+    def resolve_callback(
+        self,
+        data: str,
+    ) -> tuple[CallbackHandler, tuple[int, ...]] | None:
+        # Самый длинный зарегистрированный префикс, остаток — аргументы
+        parts = data.split(":")
+        node = self._callbacks
+        found = (node.handler, 0) if node.handler else None
+
+        for depth, part in enumerate(parts, start=1):
+            child = node.children.get(part)
+            if child is None:
+                break
+            node = child
+            if node.handler is not None:
+                found = (node.handler, depth)
+
+        if found is None:
+            return None
+        handler, depth = found
+        try:
+            return handler, tuple(int(part) for part in parts[depth:])
+        except ValueError:
+            return None
@@ -0,0 +1,57 @@
+import random
+from typing import TYPE_CHECKING
+
+from app.bot.catalog import Catalog
+from app.bot.freshness import SeenQuestions
+from app.core.metrics import metrics
+
+if TYPE_CHECKING:
+    from app.app import Application
+
+
+# Пул играбельных тем в памяти: выборка k тем стоит O(k) и не трогает базу.
+# Пул пересобирается из каталога, когда меняется версия каталога
+class ThemeSampler:
+    def __init__(self, app: "Application", catalog: Catalog):
+        self.app = app
+        self.catalog = catalog
+        self._ids: list[int] = []
+        # theme_id -> id вопросов темы
+        self._questions: dict[int, list[int]] = {}
+        self._version: int | None = None
+        catalog.on_change(self.invalidate)
+
+    def invalidate(self) -> None:
+        self._version = None
+
+    def refresh(self) -> None:
+        self._questions = self.catalog.playable(self.app.config.bot.hard_levels)
+        self._ids = list(self._questions)
+        self._version = self.catalog.version
+        metrics.set("theme_pool_size", len(self._ids))
+
+    def sample(
+        self,
+        k: int,
+        seen: SeenQuestions | None = None,
+    ) -> list[int]:
+        if self._version is None or self._version != self.catalog.version:
+            self.refresh()
+
+        if seen is None:
+            return random.sample(self._ids, min(k, len(self._ids)))
+
+        # Смотрим ограниченное число кандидатов, свежие темы идут первыми
+        attempts = k * self.app.config.bot.sample_attempts
+        fresh: list[int] = []
+        stale: list[int] = []
+        for theme_id in random.sample(self._ids, min(attempts, len(self._ids))):
+            if seen.is_seen(self._questions[theme_id]):
+                stale.append(theme_id)
+            else:
+                fresh.append(theme_id)
+                if len(fresh) == k:
+                    break
+
+        metrics.inc("theme_sample_fresh", len(fresh))
+        return (fresh + stale)[:k]
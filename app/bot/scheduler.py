@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+@dataclass
+class ChatActor:
+    queue: asyncio.Queue[tuple[float, Job, asyncio.Future[None]]] = field(
+        default_factory=asyncio.Queue,
+    )
+    task: asyncio.Task[None] | None = None
+
+
+# Обновления одного чата выполняются строго по очереди, разных — параллельно.
+# Актор, простоявший без дела idle_timeout секунд, удаляется
+class ChatScheduler:
+    def __init__(self, concurrency: int, idle_timeout: float):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._idle_timeout = idle_timeout
+        self._actors: dict[int | None, ChatActor] = {}
+
+    def __len__(self) -> int:
+        return len(self._actors)
+
+    async def run(self, chat_id: int | None, job: Job) -> None:
+        actor = self._actors.get(chat_id)
+        if actor is None:
+            actor = self._actors[chat_id] = ChatActor()
+            actor.task = asyncio.create_task(self._worker(chat_id, actor))
+
+        done = asyncio.get_running_loop().create_future()
+        actor.queue.put_nowait((time.monotonic(), job, done))
+        metrics.set("chat_queue_length", actor.queue.qsize(), chat_id=chat_id)
+        await done
+
+    async def _worker(self, chat_id: int | None, actor: ChatActor) -> None:
+        while True:
+            try:
+                enqueued_at, job, done = await asyncio.wait_for(
+                    actor.queue.get(),
+                    self._idle_timeout,
+                )
+            except TimeoutError:
+                # Между таймаутом и этой проверкой мог прийти новый апдейт
+                if actor.queue.empty():
+                    del self._actors[chat_id]
+                    metrics.remove("chat_queue_length", chat_id=chat_id)
+                    return
+                continue
+
+            async with self._semaphore:
+                metrics.observe("handler_wait_seconds", time.monotonic() - enqueued_at)
+                metrics.set("chat_queue_length", actor.queue.qsize(), chat_id=chat_id)
+                try:
+                    await job()
+                except Exception as e:
+                    done.set_exception(e)
+                else:
+                    done.set_result(None)
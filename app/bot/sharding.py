@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING, Any, cast
+from uuid import uuid4
+
+from aio_pika.abc import AbstractIncomingMessage
+
+from app.bot import callback
+from app.core.manager import RabbitMQManager
+
+if TYPE_CHECKING:
+    from app.app import Application
+    from app.core.config import RabbitmqConfig
+
+logger = logging.getLogger(__name__)
+
+# Одновременно очередь читает только один воркер — это и держит порядок в чате
+SHARD_QUEUE_ARGUMENTS = {"x-single-active-consumer": True}
+
+
+def update_chat_id(update: dict[str, Any]) -> int | None:
+    callback_query = update.get("callback_query") or {}
+    if (chat_id := callback.chat_affinity(callback_query.get("data", ""))) is not None:
+        return chat_id
+
+    message = update.get("message") or callback_query.get("message")
+    if not message:
+        return None
+    return cast(int | None, message.get("chat", {}).get("id"))
+
+
+def shard_for(chat_id: int | None, shards: int) -> int:
+    if chat_id is None:
+        return 0
+    return chat_id % shards
+
+
+def shard_queue_for_update(config: "RabbitmqConfig", update: dict[str, Any]) -> str:
+    return config.input_shard_queue(
+        shard_for(update_chat_id(update), config.input_shards),
+    )
+
+
+def owned_shards(worker_id: str, workers: list[str], shards: int) -> set[int]:
+    index = workers.index(worker_id)
+    return {shard for shard in range(shards) if shard % len(workers) == index}
+
+
+async def declare_shard_queues(
+    rabbit: RabbitMQManager,
+    config: "RabbitmqConfig",
+) -> None:
+    for shard in range(config.input_shards):
+        await rabbit.declare(config.input_shard_queue(shard), SHARD_QUEUE_ARGUMENTS)
+
+
+class ShardBalancer:
+    def __init__(
+        self,
+        app: "Application",
+        rabbit: RabbitMQManager,
+        handler: Callable[[AbstractIncomingMessage], Awaitable[None]],
+        on_release: Callable[[int], Awaitable[None]] | None = None,
+    ):
+        self.app = app
+        self.worker_id = uuid4().hex
+        self._rabbit = rabbit
+        self._handler = handler
+        self._on_release = on_release
+        self._owned: set[int] = set()
+
+    @property
+    def owned(self) -> set[int]:
+        return self._owned
+
+    async def rebalance(self) -> None:
+        accessor = self.app.accessors.worker_accessor
+        await accessor.heartbeat(self.worker_id)
+        workers = await accessor.live_workers(self.app.config.bot.heartbeat_ttl)
+        if self.worker_id not in workers:
+            workers = sorted([*workers, self.worker_id])
+
+        config = self.app.config.rabbitmq
+        owned = owned_shards(self.worker_id, workers, config.input_shards)
+
+        # Сначала отдаём чужие шарды, чтобы их быстрее подхватил новый владелец
+        for shard in sorted(self._owned - owned):
+            await self._release(shard)
+            self._owned.discard(shard)
+            logger.info("Воркер %s отдал шард %d", self.worker_id, shard)
+
+        for shard in sorted(owned - self._owned):
+            await self._rabbit.consume(self._handler, config.input_shard_queue(shard))
+            self._owned.add(shard)
+            logger.info("Воркер %s взял шард %d", self.worker_id, shard)
+
+    async def _release(self, shard: int) -> None:
+        # Состояние чатов записывается, пока очередь ещё за этим воркером:
+        # новый владелец получит её только после cancel и прочитает уже
+        # итоговые строки
+        queue_name = self.app.config.rabbitmq.input_shard_queue(shard)
+        if not await self._rabbit.drain(queue_name, self.app.config.bot.drain_timeout):
+            logger.warning("Не дождались обработки сообщений очереди %s", queue_name)
+        if self._on_release is not None:
+            await self._on_release(shard)
+        await self._rabbit.cancel(queue_name)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.rebalance()
+            except Exception:
+                logger.exception("Не удалось перераспределить шарды")
+            await asyncio.sleep(self.app.config.bot.heartbeat_interval)
+
+    async def stop(self) -> None:
+        for shard in sorted(self._owned):
+            await self._release(shard)
+        self._owned.clear()
+        await self.app.accessors.worker_accessor.remove(self.worker_id)
@@ -1,71 +1,95 @@
 from random import choice
 
 from app.app import app, setup_app
-from app.bot.models import AnswerStatusEnum, TelegramUserModel
+from app.bot.callback import CallbackAction
+from app.bot.engine import GameState
+from app.bot.models import AnswerStatusEnum
 from app.bot.schemas import CallbackQuery, Chat, Message
 from app.bot.utils import escape_markdown_v2
 
 setup_app()
 bot = app.bot_api
+
+TOP_SIZE = 10
+TOP_LIMIT = 50
 app.database.connect()
 
 
+async def lobby_keyboard() -> list[list[tuple[str, str]]]:
+    return [
+        [("Начать игру", await bot.callback_data(CallbackAction.START_GAME))],
+        [("Присоединиться", await bot.callback_data(CallbackAction.CONNECT_TO_GAME))],
+    ]
+
+
 async def generate_question_keyboard(
     call_or_chat: CallbackQuery | Chat,
-    user: TelegramUserModel,
+    state: GameState,
 ) -> None:
-    if isinstance(call_or_chat, CallbackQuery):
-        groups = await app.accessors.game_accessor.all_questions(
-            call_or_chat.message.chat,
-        )
-        if not groups:
+    themes = state.themes()
+    if not themes:
+        if isinstance(call_or_chat, CallbackQuery):
             await bot.send_message(
                 call_or_chat.message.chat,
                 "Нет вопросов в текущем раунде",
             )
-            return
-    else:
-        groups = await app.accessors.game_accessor.all_questions(call_or_chat)
-        if not groups:
+        else:
             await bot.send_message(call_or_chat, "Нет вопросов в текущем раунде")
-            return
+        return
 
     lines = []
     keyboard = []
+    answered = await bot.callback_data(CallbackAction.ANSWERED)
 
-    for idx, group in enumerate(groups, start=1):
-        theme = group[0].theme
-        lines.append(f"{idx}. {theme.title}")
+    for idx, cells in enumerate(themes, start=1):
+        lines.append(f"{idx}. {cells[0].theme_title}")
 
         row = []
-        for qtt in sorted(group, key=lambda x: x.question.hard_level):
-            price = qtt.question.hard_level * 100
+        for cell in cells:
+            price = cell.hard_level * 100
 
-            if qtt.status == AnswerStatusEnum.ANSWERED:
-                row.append(("-X-X-", "answered"))
+            if cell.status == AnswerStatusEnum.ANSWERED:
+                row.append(("-X-X-", answered))
             else:
-                row.append(
-                    (f"{idx}) {price}", f"btn_choice:{qtt.round_id}:{qtt.question_id}"),
+                data = await bot.callback_data(
+                    CallbackAction.CHOICE,
+                    state.round_id,
+                    cell.question_id,
                 )
+                row.append((f"{idx}) {price}", data))
         keyboard.append(row)
 
+    username = state.players.get(state.choice_user_id or 0)
     if isinstance(call_or_chat, CallbackQuery):
         await bot.edit_message_text(
             call_or_chat.message.chat.id,
             call_or_chat.message.message_id,
-            f"Итак, начнём!\n\nВыбирает тему @{user.username}:\n" + "\n".join(lines),
+            f"Итак, начнём!\n\nВыбирает тему @{username}:\n" + "\n".join(lines),
             keyboard=keyboard,
         )
     else:
         await bot.send_message(
             call_or_chat,
-            f"А мы продолжаем!\n\nВыбирает тему @{user.username}:\n" + "\n".join(lines),
+            f"А мы продолжаем!\n\nВыбирает тему @{username}:\n" + "\n".join(lines),
             keyboard=keyboard,
         )
 
 
+async def continue_game(chat: Chat, state: GameState) -> None:
+    if state.has_questions():
+        await generate_question_keyboard(chat, state)
+        return
+
+    next_ = await bot.engine.next_round(chat.id)
+    if next_ is None:
+        await summarize_the_results(chat)
+        return
+
+    await generate_question_keyboard(chat, next_)
+
+
 @bot.connect_handler(commands=["rule"])
-async def rule(message: Message) -> None:
+async def rule(message: Message, args: list[str]) -> None:
     await bot.send_message(
         message.chat,
         "Основной цикл игры:\n"
@@ -84,27 +108,55 @@ async def rule(message: Message) -> None:
 
 
 @bot.connect_handler(commands=["info"])
-async def info(message: Message) -> None:
+async def info(message: Message, args: list[str]) -> None:
     user = await app.accessors.user_accessor.get_or_create(message.from_)
+    entry = bot.leaderboard.rank(user.id)
+    place = "—" if entry is None else entry.rank
     await bot.send_message(
         message.chat,
         "Статистика на игрока:\n"
         "\n"
         f"Общий счёт за все игры: {user.score}\n"
         f"Кол-во побед: {user.win_count}\n"
-        f"Кол-во поражений: {user.loss_count}\n",
+        f"Кол-во поражений: {user.loss_count}\n"
+        f"Место в общем рейтинге: {place}\n",
         reply_to_message_id=message.message_id,
     )
 
 
-async def summarize_the_results(chat: Chat, game_id: int) -> None:
-    profiles = await app.accessors.game_accessor.all_profiles(game_id)
+@bot.connect_handler(commands=["top"])
+async def top(message: Message, args: list[str]) -> None:
+    limit = TOP_SIZE
+    if args and args[0].isdigit():
+        limit = min(int(args[0]), TOP_LIMIT) or TOP_SIZE
 
-    profiles = sorted(profiles, key=lambda p: p.score, reverse=True)
-    lines = []
-    for i, profile in enumerate(profiles):
-        lines.append(f"@{profile.user.username} — {profile.score}")
-        await app.accessors.game_accessor.summarize(profile, i == 0)
+    entries = bot.leaderboard.top(limit)
+    if not entries:
+        await bot.send_message(message.chat, "Рейтинг пока пуст")
+        return
+
+    lines = [f"{e.rank}. @{e.username} — {e.score}" for e in entries]
+    own = bot.leaderboard.rank(message.from_.id)
+    if own is not None and own.rank > limit:
+        lines.extend(["...", f"{own.rank}. @{own.username} — {own.score}"])
+
+    await bot.send_message(
+        message.chat,
+        "Общий рейтинг игроков:\n\n" + "\n".join(lines),
+        reply_to_message_id=message.message_id,
+    )
+
+
+async def summarize_the_results(chat: Chat) -> None:
+    game = await app.accessors.game_accessor.get_active_game(chat)
+    if game is None:
+        return
+
+    rows = await app.accessors.game_accessor.finalize(game)
+    lines = [f"@{row.username} — {row.score}" for row in rows]
+
+    totals = [(row.id, row.username, row.total) for row in rows]
+    await bot.after_commit(lambda: bot.leaderboard_feed.publish(totals))
 
     await bot.send_message(
         chat,
@@ -113,7 +165,7 @@ async def summarize_the_results(chat: Chat, game_id: int) -> None:
 
 
 @bot.connect_handler(commands=["start", "приветик"])
-async def start(message: Message) -> None:
+async def start(message: Message, args: list[str]) -> None:
     if message.chat.type == "private":
         await bot.send_message(
             message.chat,
@@ -125,32 +177,30 @@ async def start(message: Message) -> None:
         await bot.send_message(message.chat, "В этом чате уже есть активная игра")
         return
 
-    master = await app.accessors.user_accessor.get_or_create(message.from_)
-    await app.accessors.game_accessor.create(message.chat.id, master.id)
+    await app.accessors.user_accessor.ensure(message.from_)
+    await app.accessors.game_accessor.create(message.chat.id, message.from_.id)
     await bot.send_message(
         message.chat,
         "Новая игра\n\nНет\nСвоя игра!",
-        [
-            [("Начать игру", "start_game")],
-            [("Присоединиться", "connect_to_game")],
-        ],
+        await lobby_keyboard(),
     )
 
 
 @bot.connect_handler(commands=["stop", "пакетик"])
-async def stop(message: Message) -> None:
+async def stop(message: Message, args: list[str]) -> None:
     game = await app.accessors.game_accessor.get_active_game(message.chat)
     if game is None:
         return
 
+    await bot.engine.evict(message.chat.id)
     await app.accessors.game_accessor.complete(game)
 
     if game.master_id == message.from_.id:
         await bot.send_message(message.chat, "Игра завершена досрочно")
 
 
-@bot.connect_callback_handler("start_game")
-async def start_game_handler(call: CallbackQuery) -> None:
+@bot.connect_callback_handler(CallbackAction.START_GAME)
+async def start_game_handler(call: CallbackQuery, args: tuple[int, ...]) -> None:
     if (
         await app.accessors.game_accessor.get(
             call.message.chat.id,
@@ -174,17 +224,21 @@ async def start_game_handler(call: CallbackQuery) -> None:
         )
         return
 
-    await app.accessors.game_accessor.next_round(call.message.chat)
-    user = await app.accessors.game_accessor.set_choice_user(
-        call.message.chat,
-        choice(users),
-    )
+    state = await bot.engine.next_round(call.message.chat.id)
+    if state is None:
+        await bot.answer_callback_query(
+            call,
+            "Не удалось собрать раунд",
+            show_alert=True,
+        )
+        return
 
-    await generate_question_keyboard(call, user)
+    bot.engine.set_choice_user(state, choice(users).id)
+    await generate_question_keyboard(call, state)
 
 
-@bot.connect_callback_handler("connect_to_game")
-async def connect_handler(call: CallbackQuery) -> None:
+@bot.connect_callback_handler(CallbackAction.CONNECT_TO_GAME)
+async def connect_handler(call: CallbackQuery, args: tuple[int, ...]) -> None:
     if (
         await app.accessors.game_accessor.get(
             call.message.chat.id,
@@ -210,32 +264,24 @@ async def connect_handler(call: CallbackQuery) -> None:
         "\n"
         "Наши участники:"
         "\n" + "\n".join(["- @" + user.username for user in users]),
-        keyboard=[
-            [("Начать игру", "start_game")],
-            [("Присоединиться", "connect_to_game")],
-        ],
+        keyboard=await lobby_keyboard(),
     )
 
 
-@bot.connect_callback_handler()
-async def choice_button(call: CallbackQuery) -> None:
-    if call.data.startswith("answered"):
-        await bot.answer_callback_query(call)
-    elif call.data.startswith("btn_choice"):
-        await handle_btn_choice(call)
-    elif call.data.startswith("btn_answer"):
-        await handle_btn_answer(call)
-    else:
-        await handle_result_callback(call)
-
+@bot.connect_callback_handler(CallbackAction.ANSWERED)
+async def handle_answered(call: CallbackQuery, args: tuple[int, ...]) -> None:
     await bot.answer_callback_query(call)
 
 
-async def handle_btn_choice(call: CallbackQuery) -> None:
-    game = await app.accessors.game_accessor.get_active_game(call.message.chat)
-    round_id, question_id = map(int, call.data.split(":")[1:])
+@bot.connect_callback_handler(CallbackAction.CHOICE)
+async def handle_btn_choice(call: CallbackQuery, args: tuple[int, ...]) -> None:
+    round_id, question_id = args
+    state = await bot.engine.get(call.message.chat.id)
+    if state is None or state.round_id != round_id or question_id not in state.board:
+        await bot.answer_callback_query(call)
+        return
 
-    if game.choice_user_id != call.from_.id:
+    if state.choice_user_id != call.from_.id:
         await bot.answer_callback_query(
             call,
             "Не ты выбираешь тему!",
@@ -243,76 +289,103 @@ async def handle_btn_choice(call: CallbackQuery) -> None:
         )
         return
 
-    await app.accessors.game_accessor.generate_users_answer_status(
-        call.message.chat,
-        question_id,
-        round_id,
-    )
-    qst = await app.accessors.game_accessor.get_question_by_id(question_id)
+    await bot.engine.pick_question(state, question_id)
+    cell = state.board[question_id]
     await bot.edit_message_text(
         call.message.chat.id,
         call.message.message_id,
-        f"Окей, игрок @{call.from_.username}, выбрал вопрос:\n\n{qst.text}",
+        f"Окей, игрок @{call.from_.username}, выбрал вопрос:\n\n{cell.text}",
         keyboard=[
-            [("Ответить", f"btn_answer:{round_id}:{question_id}")],
+            [
+                (
+                    "Ответить",
+                    await bot.callback_data(
+                        CallbackAction.ANSWER,
+                        round_id,
+                        question_id,
+                    ),
+                ),
+            ],
         ],
     )
+    await bot.answer_callback_query(call)
 
 
-async def handle_btn_answer(call: CallbackQuery) -> None:
-    round_id, question_id = map(int, call.data.split(":")[1:])
-    game = await app.accessors.game_accessor.get_active_game(call.message.chat)
+@bot.connect_callback_handler(CallbackAction.ANSWER)
+async def handle_btn_answer(call: CallbackQuery, args: tuple[int, ...]) -> None:
+    round_id, question_id = args
+    state = await bot.engine.get(call.message.chat.id)
+    if state is None or state.round_id != round_id or question_id not in state.board:
+        await bot.answer_callback_query(call)
+        return
 
-    if game.master_id == call.from_.id:
+    if state.master_id == call.from_.id:
         await bot.answer_callback_query(
             call,
             "Ты ведущий! Помни об этом",
             show_alert=True,
         )
+        return
 
-    if await app.accessors.game_accessor.has_answer(
-        call.from_.id,
-        round_id,
-        question_id,
+    if (
+        state.answers.get((question_id, call.from_.id))
+        != AnswerStatusEnum.NOT_ANSWERED
     ):
         await bot.answer_callback_query(call, "Ты уже ответил!", show_alert=True)
         return
 
-    await app.accessors.game_accessor.set_active_user(
-        call.message.chat,
-        call.from_,
-        call.from_.id,
-        question_id,
-        round_id,
-    )
-    qst = await app.accessors.game_accessor.get_question_by_id(question_id)
+    if not bot.engine.buzz_in(state, call.from_.id, question_id):
+        await bot.answer_callback_query(
+            call,
+            "Тебя опередили, уже отвечает другой игрок",
+            show_alert=True,
+        )
+        return
+
+    cell = state.board[question_id]
     await bot.edit_message_text(
         call.message.chat.id,
         call.message.message_id,
         f"Отвечает @{call.from_.username}\n"
         "\n"
-        f"{qst.text}\n"
+        f"{cell.text}\n"
         "\n"
         "Следующие ваше сообщение будет считаться ответом",
     )
+    await bot.answer_callback_query(call)
 
 
-async def handle_result_callback(call: CallbackQuery) -> None:
-    result, user_id, game_id, reply, question_id = call.data.split(":")
-    user_id, game_id, reply, question_id = list(
-        map(int, [user_id, game_id, reply, question_id])
-    )
-    game = await app.accessors.game_accessor.get_by_id(game_id)
-    round_ = await app.accessors.game_accessor.get_current_round(
-        Chat(id=game.chat_id),
-    )
-    user = await app.accessors.user_accessor.get_by_id(user_id)
-    qst = await app.accessors.game_accessor.get_question_by_user_round(
-        user_id,
-        question_id,
-        round_,
-    )
-    score = qst.hard_level * round_.base_score
+@bot.connect_callback_handler(CallbackAction.CORRECT)
+async def handle_correct(call: CallbackQuery, args: tuple[int, ...]) -> None:
+    await handle_result_callback(call, args, is_correct=True)
+    await bot.answer_callback_query(call)
+
+
+@bot.connect_callback_handler(CallbackAction.WRONG)
+async def handle_wrong(call: CallbackQuery, args: tuple[int, ...]) -> None:
+    await handle_result_callback(call, args, is_correct=False)
+    await bot.answer_callback_query(call)
+
+
+async def handle_result_callback(
+    call: CallbackQuery,
+    args: tuple[int, ...],
+    *,
+    is_correct: bool,
+) -> None:
+    chat_id, user_id, game_id, reply, question_id = args
+    state = await bot.engine.get(chat_id)
+    if (
+        state is None
+        or state.game_id != game_id
+        or state.active_user_id != user_id
+        or question_id not in state.board
+    ):
+        return
+
+    chat = Chat(id=chat_id)
+    cell = state.board[question_id]
+    score = cell.hard_level * state.base_score
 
     await bot.edit_message_text(
         call.message.chat.id,
@@ -320,161 +393,127 @@ async def handle_result_callback(call: CallbackQuery) -> None:
         call.message.text,
     )
 
-    if result == "correct":
-        await app.accessors.game_accessor.add_score(user_id, game_id, score)
+    if is_correct:
+        bot.engine.add_score(state, user_id, score)
         await bot.send_message(
-            Chat(id=game.chat_id),
+            chat,
             f"Иии.. ваш ответ верен!\n+ {score} очков",
             reply_to_message_id=reply,
         )
-        await app.accessors.game_accessor.set_choice_user(
-            Chat(id=game.chat_id), user
-        )
-        await app.accessors.game_accessor.set_active_user_null(
-            Chat(id=game.chat_id),
-        )
+        bot.engine.set_choice_user(state, user_id)
+        bot.engine.set_active_user_null(state)
+        await continue_game(chat, state)
+        return
 
-        if await app.accessors.game_accessor.has_questions(round_):
-            await generate_question_keyboard(Chat(id=game.chat_id), user)
-        else:
-            next_ = await app.accessors.game_accessor.next_round(
-                Chat(id=game.chat_id),
-            )
-            if next_ is False:
-                await summarize_the_results(Chat(id=game.chat_id), game_id)
-    else:
-        await app.accessors.game_accessor.add_score(user_id, game_id, -score)
+    bot.engine.add_score(state, user_id, -score)
+    await bot.send_message(
+        chat,
+        f"Иии.. увы, ваш ответ неверен!\n- {score} очков",
+        reply_to_message_id=reply,
+    )
+    bot.engine.set_active_user_null(state)
+    if state.has_user_not_answered(question_id):
         await bot.send_message(
-            Chat(id=game.chat_id),
-            f"Иии.. увы, ваш ответ неверен!\n- {score} очков",
-            reply_to_message_id=reply,
-        )
-        await app.accessors.game_accessor.set_active_user_null(
-            Chat(id=game.chat_id),
-        )
-        if await app.accessors.game_accessor.has_user_not_answered(
-            round_.id,
-            question_id,
-        ):
-            await bot.send_message(
-                Chat(id=game.chat_id),
-                f"Может кто-то другой ответит на вопрос?:\n\n{qst.text}",
-                keyboard=[
-                    [("Ответить", f"btn_answer:{round_.id}:{question_id}")],
+            chat,
+            f"Может кто-то другой ответит на вопрос?:\n\n{cell.text}",
+            keyboard=[
+                [
+                    (
+                        "Ответить",
+                        await bot.callback_data(
+                            CallbackAction.ANSWER,
+                            state.round_id,
+                            question_id,
+                        ),
+                    ),
                 ],
-            )
-            return
-
-        await bot.send_message(
-            Chat(id=game.chat_id),
-            "Пу пу пу, никто не ответил, правильно\n"
-            "\n"
-            "А правильный ответ был\n"
-            f"{qst.answer}",
+            ],
         )
+        return
 
-        if await app.accessors.game_accessor.has_questions(round_):
-            await generate_question_keyboard(Chat(id=game.chat_id), user)
-        else:
-            next_ = await app.accessors.game_accessor.next_round(
-                Chat(id=game.chat_id),
-            )
-            if next_ is False:
-                await summarize_the_results(Chat(id=game.chat_id), game_id)
+    await bot.send_message(
+        chat,
+        "Пу пу пу, никто не ответил, правильно\n"
+        "\n"
+        "А правильный ответ был\n"
+        f"{cell.answer}",
+    )
+    await continue_game(chat, state)
 
 
 @bot.connect_handler()
-async def start_game(message: Message) -> None:
-    game = await app.accessors.game_accessor.get_active_game(message.chat)
-    if game is None:
+async def start_game(message: Message, args: list[str]) -> None:
+    state = bot.engine.peek(message.chat.id)
+    if state is None:
+        # Обычная переписка не должна поднимать игру: сначала один запрос
+        if await app.accessors.game_accessor.get_question_by_message(message) is None:
+            return
+        state = await bot.engine.get(message.chat.id)
+
+    if state is None or state.active_user_id is None:
         return
 
-    active_user = await app.accessors.game_accessor.get_active_user(message.chat)
-    if active_user is None:
+    if message.from_.id != state.active_user_id:
         return
 
-    if message.from_.id == active_user.id:
-        question = await app.accessors.game_accessor.get_question_by_message(message)
-        round_ = await app.accessors.game_accessor.get_current_round(message.chat)
+    cell = state.pending_question(message.from_.id)
+    if cell is None:
+        return
 
-        if await app.accessors.game_accessor.is_answered(
-            message.from_.id,
-            question.id,
-            round_.id,
-        ):
-            return
+    bot.engine.mark_answered(state, message.from_.id, cell.question_id)
 
-        await app.accessors.game_accessor.set_user_answered(
-            message.from_.id,
-            question.id,
-            round_.id,
-        )
-        await app.accessors.game_accessor.set_question_answered(
-            question.theme.id,
-            question.id,
-            round_.id,
+    correct, wrong = CallbackAction.CORRECT, CallbackAction.WRONG
+    verdict = (
+        message.chat.id,
+        message.from_.id,
+        state.game_id,
+        message.message_id,
+        cell.question_id,
+    )
+    try:
+        await bot.send_message(
+            Chat(id=state.master_id),
+            f"Игрок @{escape_markdown_v2(message.from_.username)} выбрал вопрос:\n"
+            "```\n"
+            f"{cell.text}"
+            "```\n"
+            "\n"
+            "Ответ:\n"
+            "```\n"
+            f"{cell.answer}"
+            "```\n"
+            "\n"
+            "Ответ игрока:\n"
+            "```\n"
+            f"{message.text}"
+            f"```",
+            parse_mode="MarkdownV2",
+            keyboard=[
+                [
+                    ("Верно", await bot.callback_data(correct, *verdict)),
+                    ("Неверно", await bot.callback_data(wrong, *verdict)),
+                ],
+            ],
         )
-
-        try:
+    except RuntimeError as err:
+        if "Forbidden: bot can't initiate conversation with a user" in str(err):
             await bot.send_message(
-                Chat(id=game.master_id),
-                f"Игрок @{escape_markdown_v2(message.from_.username)} выбрал вопрос:\n"
-                "```\n"
-                f"{question.text}"
-                "```\n"
+                message.chat,
+                "Я не могу написать ведущему первым, "
+                "чтобы отправить на проверку ответ\n"
                 "\n"
-                "Ответ:\n"
-                "```\n"
-                f"{question.answer}"
-                "```\n"
-                "\n"
-                "Ответ игрока:\n"
-                "```\n"
-                f"{message.text}"
-                f"```",
-                parse_mode="MarkdownV2",
-                keyboard=[
-                    [
-                        (
-                            "Верно",
-                            f"correct:{message.from_.id}:{game.id}:{message.message_id}:{question.id}",
-                        ),
-                        (
-                            "Неверно",
-                            f"wrong:{message.from_.id}:{game.id}:{message.message_id}:{question.id}",
-                        ),
-                    ],
-                ],
+                "Ответ не засчитан",
             )
-        except RuntimeError as err:
-            if "Forbidden: bot can't initiate conversation with a user" in str(err):
-                await bot.send_message(
-                    message.chat,
-                    "Я не могу написать ведущему первым, "
-                    "чтобы отправить на проверку ответ\n"
-                    "\n"
-                    "Ответ не засчитан",
-                )
-
-                await app.accessors.game_accessor.set_active_user_null(message.chat)
 
-                if await app.accessors.game_accessor.has_questions(round_):
-                    user = await app.accessors.user_accessor.get_by_id(message.from_.id)
-                    await generate_question_keyboard(message.chat, user)
-                else:
-                    next_ = await app.accessors.game_accessor.next_round(
-                        Chat(id=game.chat_id),
-                    )
-                    if next_ is False:
-                        await summarize_the_results(message.chat, game.id)
-
-                return
+            bot.engine.set_active_user_null(state)
+            await continue_game(message.chat, state)
+            return
 
-        await bot.send_message(
-            message.chat,
-            "Ваш ответ мы отправили ведущему на проверку",
-            reply_to_message_id=message.message_id,
-        )
+    await bot.send_message(
+        message.chat,
+        "Ваш ответ мы отправили ведущему на проверку",
+        reply_to_message_id=message.message_id,
+    )
 
 
 if __name__ == "__main__":
@@ -7,8 +7,15 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from app.admin.accessor import AdminAccessor, ThemeAccessor
-from app.bot.accessor import GameAccessor, UserAccessor
+from app.bot.accessor import (
+    CallbackTokenAccessor,
+    GameAccessor,
+    HistoryAccessor,
+    UserAccessor,
+    WorkerAccessor,
+)
 from app.core.accessor_base import BaseAccessor
+from app.poller.accessor import OffsetAccessor
 
 if TYPE_CHECKING:
     from app.app import Application
@@ -30,15 +37,23 @@ class Accessors:
     base_accessor: BaseAccessor
     user_accessor: UserAccessor
     game_accessor: GameAccessor
+    history_accessor: HistoryAccessor
+    worker_accessor: WorkerAccessor
+    callback_token_accessor: CallbackTokenAccessor
     admin_accessor: AdminAccessor
     theme_accessor: ThemeAccessor
+    offset_accessor: OffsetAccessor
 
     def __init__(self, app: "Application"):
         self.base_accessor = BaseAccessor(app)
         self.user_accessor = UserAccessor(app)
         self.game_accessor = GameAccessor(app)
+        self.history_accessor = HistoryAccessor(app)
+        self.worker_accessor = WorkerAccessor(app)
+        self.callback_token_accessor = CallbackTokenAccessor(app)
         self.admin_accessor = AdminAccessor(app)
         self.theme_accessor = ThemeAccessor(app)
+        self.offset_accessor = OffsetAccessor(app)
 
 
 def setup_accessors(app: "Application") -> None:
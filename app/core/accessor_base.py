@@ -1,6 +1,6 @@
 from asyncio import current_task
-from collections.abc import AsyncGenerator, Sequence
-from contextlib import asynccontextmanager
+from collections.abc import AsyncGenerator, Generator, Hashable, Sequence
+from contextlib import asynccontextmanager, contextmanager
 from contextvars import ContextVar
 from typing import TYPE_CHECKING, Any
 
@@ -17,14 +17,24 @@ if TYPE_CHECKING:
     from app.app import Application
 
 
+# Общая для всех аксессоров, иначе сессия одного не видна другому
+_current_session: ContextVar[AsyncSession | None] = ContextVar(
+    "current_session",
+    default=None,
+)
+
+# Кеш загруженных объектов в пределах одного апдейта
+_identity_map: ContextVar[dict[Hashable, Any] | None] = ContextVar(
+    "identity_map",
+    default=None,
+)
+
+
 class BaseAccessor:
     def __init__(self, app: "Application"):
         self.app = app
-
-        self._current_session: ContextVar[AsyncSession | None] = ContextVar(
-            "current_session",
-            default=None,
-        )
+        self._current_session = _current_session
+        self._identity_map = _identity_map
 
     @property
     def session_maker(self) -> async_sessionmaker[AsyncSession]:
@@ -41,27 +51,40 @@ class BaseAccessor:
 
         async with scoped_session() as session:
             token = self._current_session.set(session)
-
-            yield session
-            await session.commit()
-
-            self._current_session.reset(token)
-            await scoped_session.remove()
+            try:
+                yield session
+                await session.commit()
+            finally:
+                self._current_session.reset(token)
+                await scoped_session.remove()
 
     def get_current_session(self) -> AsyncSession | None:
         return self._current_session.get()
 
+    @contextmanager
+    def identity_map(self) -> Generator[dict[Hashable, Any], None, None]:
+        identity_map: dict[Hashable, Any] = {}
+        token = self._identity_map.set(identity_map)
+        try:
+            yield identity_map
+        finally:
+            self._identity_map.reset(token)
+
+    def get_identity_map(self) -> dict[Hashable, Any] | None:
+        return self._identity_map.get()
+
     async def execute(
         self,
         statement: Executable,
+        params: Sequence[dict[str, Any]] | None = None,
     ) -> CursorResult[Any] | Result[Any]:
         session = self.get_current_session()
 
         if session:
-            return await session.execute(statement)
+            return await session.execute(statement, params)
 
         async with self.session() as session:
-            return await session.execute(statement)
+            return await session.execute(statement, params)
 
     async def scalar(self, statement: Executable) -> Any | None:
         return (await self.execute(statement)).scalar()
@@ -1,10 +1,12 @@
 import typing
 from functools import cached_property
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PositiveInt
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from sqlalchemy.engine.url import URL
 
+from app.core.lanes import OutputLane
+
 if typing.TYPE_CHECKING:
     from app.app import Application
 
@@ -15,6 +17,25 @@ class SessionConfig(BaseModel):
 
 class BotConfig(BaseModel):
     token: str = "..."
+    username: str | None = None
+    heartbeat_interval: float = 5
+    heartbeat_ttl: float = 15
+    drain_timeout: float = 10
+    prefetch_count: int = 100
+    concurrency: int = 20
+    actor_idle_timeout: float = 60
+    metrics_interval: float = 60
+    flush_interval: float = 0.5
+    themes_per_round: int = 3
+    hard_levels: int = 3
+    seen_decay: float = 30 * 24 * 60 * 60
+    seen_cache_size: int = 10_000
+    sample_attempts: int = 4
+    user_cache_size: int = 10_000
+    # Кнопки из токенов нужны лишь до конца игры, неделя — это большой запас
+    callback_token_ttl: float = 7 * 24 * 60 * 60
+    cleanup_interval: float = 60 * 60
+    catalog_poll_interval: float = 60
 
 
 class AdminConfig(BaseSettings):
@@ -22,6 +43,45 @@ class AdminConfig(BaseSettings):
     password: str = "admin"
 
 
+class PollerConfig(BaseModel):
+    mode: typing.Literal["polling", "webhook"] = "polling"
+    timeout: int = 30
+    limit: int = 100
+    keepalive_timeout: float = 75
+    retry_delay: float = 1
+
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8081
+    webhook_path: str = "/webhook"
+    webhook_url: str | None = None
+    webhook_secret: str | None = None
+    webhook_max_connections: int = 40
+
+
+class SenderConfig(BaseModel):
+    prefetch_count: int = 100
+    concurrency: int = 50
+    limit_per_host: int = 50
+    keepalive_timeout: float = 60
+    dns_cache_ttl: int = 300
+    timeout: float = 30
+    global_rate: float = 30
+    chat_rate: float = 1
+    group_rate_per_minute: int = 20
+    max_retries: int = 5
+    # Задержки повторной отправки в секундах, по одной на попытку
+    retry_delays: list[int] = [5, 30, 120, 600]
+    # Доли отправок по полосам, когда очередь есть во всех сразу
+    callback_weight: PositiveInt = 8
+    edit_weight: PositiveInt = 3
+    send_weight: PositiveInt = 1
+    # Сколько сообщений одного чата процесс держит неподтверждёнными. Лишние
+    # подтверждаются сразу и ждут в памяти, чтобы шумный чат не занял prefetch
+    chat_backlog: PositiveInt = 10
+    # Предел подтверждённых, но ещё не отправленных сообщений на процесс
+    buffer_size: PositiveInt = 1000
+
+
 class DatabaseConfig(BaseModel):
     host: str = "localhost"
     port: int = 5432
@@ -47,7 +107,19 @@ class RabbitmqConfig(BaseModel):
     user: str = "guest"
     password: str = "guest"
     input_queue: str = "input_queue"
+    input_shards: int = 1
     output_queue: str = "output_queue"
+    leaderboard_exchange: str = "leaderboard"
+    catalog_exchange: str = "catalog"
+
+    def input_shard_queue(self, shard: int) -> str:
+        return f"{self.input_queue}.{shard}"
+
+    def output_lane_queue(self, lane: OutputLane) -> str:
+        # Обычные отправки остаются в прежней очереди
+        if lane == OutputLane.SEND:
+            return self.output_queue
+        return f"{self.output_queue}.{lane}"
 
     @cached_property
     def url(self) -> str:
@@ -60,6 +132,8 @@ class Config(BaseSettings):
     bot: BotConfig
     database: DatabaseConfig
     rabbitmq: RabbitmqConfig
+    poller: PollerConfig = PollerConfig()
+    sender: SenderConfig = SenderConfig()
 
     model_config = SettingsConfigDict(
         # Если main / если poller / если миграции
@@ -0,0 +1,33 @@
+"""bot worker
+
+Revision ID: 8c3f0a6e2b17
+Revises: 5b1e7c2d9a41
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8c3f0a6e2b17"
+down_revision: str | None = "5b1e7c2d9a41"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "bot_worker",
+        sa.Column("id", sa.String(length=32), nullable=False),
+        sa.Column("heartbeat_at", sa.TIMESTAMP(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_bot_worker")),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("bot_worker")
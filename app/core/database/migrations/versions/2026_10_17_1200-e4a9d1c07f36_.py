@@ -0,0 +1,34 @@
+"""callback token
+
+Revision ID: e4a9d1c07f36
+Revises: 8c3f0a6e2b17
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e4a9d1c07f36"
+down_revision: str | None = "8c3f0a6e2b17"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "callback_token",
+        sa.Column("token", sa.String(length=16), nullable=False),
+        sa.Column("payload", sa.LargeBinary(), nullable=False),
+        sa.Column("create_at", sa.TIMESTAMP(), nullable=False),
+        sa.PrimaryKeyConstraint("token", name=op.f("pk_callback_token")),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("callback_token")
@@ -0,0 +1,35 @@
+"""chat history
+
+Revision ID: 3d6b8f21c5e0
+Revises: e4a9d1c07f36
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3d6b8f21c5e0"
+down_revision: str | None = "e4a9d1c07f36"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "chat_history",
+        sa.Column("chat_id", sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column("current", sa.LargeBinary(), nullable=False),
+        sa.Column("previous", sa.LargeBinary(), nullable=False),
+        sa.Column("epoch_at", sa.TIMESTAMP(), nullable=False),
+        sa.PrimaryKeyConstraint("chat_id", name=op.f("pk_chat_history")),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("chat_history")
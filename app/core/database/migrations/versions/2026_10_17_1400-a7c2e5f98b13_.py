@@ -0,0 +1,88 @@
+"""hot path indexes
+
+Revision ID: a7c2e5f98b13
+Revises: 3d6b8f21c5e0
+Create Date: 2026-10-17 14:00:00.000000
+
+Для живой базы индексы строятся без блокировки записи:
+    alembic -x concurrently=true upgrade head
+"""
+
+from collections.abc import Sequence
+from typing import Any
+
+import sqlalchemy as sa
+from alembic import context, op
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c2e5f98b13"
+down_revision: str | None = "3d6b8f21c5e0"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+INDEXES: list[tuple[str, str, list[str], dict[str, Any]]] = [
+    (
+        "ix_game_chat_id_active",
+        "game",
+        ["chat_id"],
+        {"postgresql_where": sa.text("status != 'COMPLETED'")},
+    ),
+    ("ix_telegram_user_to_game_game_id", "telegram_user_to_game", ["game_id"], {}),
+    ("ix_round_to_game_game_id", "round_to_game", ["game_id"], {}),
+    (
+        "ix_question_to_theme_round_id_status",
+        "question_to_theme",
+        ["round_id", "status"],
+        {},
+    ),
+    (
+        "ix_telegram_user_to_round_round_id_question_id_state",
+        "telegram_user_to_round",
+        ["round_id", "question_id", "state"],
+        {},
+    ),
+    ("ix_question_theme_id_hard_level", "question", ["theme_id", "hard_level"], {}),
+]
+
+
+def _concurrently() -> bool:
+    value = context.get_x_argument(as_dictionary=True).get("concurrently", "")
+    return value.lower() in {"1", "true", "yes"}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _concurrently():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(name, table, columns, unique=False, **kwargs)
+        return
+
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+                **kwargs,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not _concurrently():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table)
+        return
+
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
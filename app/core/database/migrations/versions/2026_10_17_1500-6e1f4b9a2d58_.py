@@ -0,0 +1,32 @@
+"""telegram user score index
+
+Revision ID: 6e1f4b9a2d58
+Revises: a7c2e5f98b13
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "6e1f4b9a2d58"
+down_revision: str | None = "a7c2e5f98b13"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_telegram_user_score_id",
+        "telegram_user",
+        ["score", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_telegram_user_score_id", table_name="telegram_user")
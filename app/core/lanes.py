@@ -0,0 +1,19 @@
+from enum import StrEnum
+
+
+# Полосы очереди исходящих сообщений в порядке приоритета: ответ на нажатие
+# кнопки должен дойти за секунды, правка доски — вскоре, остальное подождёт
+class OutputLane(StrEnum):
+    CALLBACK = "callback"
+    EDIT = "edit"
+    SEND = "send"
+
+
+LANE_BY_METHOD = {
+    "answerCallbackQuery": OutputLane.CALLBACK,
+    "editMessageText": OutputLane.EDIT,
+}
+
+
+def lane_for_method(method: str) -> OutputLane:
+    return LANE_BY_METHOD.get(method, OutputLane.SEND)
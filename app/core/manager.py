@@ -1,39 +1,268 @@
-from collections.abc import Awaitable, Callable
+import asyncio
+from collections import defaultdict
+from collections.abc import Awaitable, Callable, Iterable, Sequence
+from typing import Any
 
 import aio_pika
-from aio_pika import Message
+from aio_pika import DeliveryMode, Message
 from aio_pika.abc import AbstractIncomingMessage
 
+ATTEMPT_HEADER = "x-attempt"
+ERROR_HEADER = "x-error"
+ERROR_HEADER_LIMIT = 1000
+
 
 class RabbitMQManager:
-    def __init__(self, amqp_url: str, queue_name: str):
+    def __init__(
+        self,
+        amqp_url: str,
+        queue_name: str,
+        arguments: dict[str, Any] | None = None,
+        prefetch_count: int | None = None,
+    ):
         self._url = amqp_url
         self._queue_name = queue_name
+        self._arguments = arguments
+        self._prefetch_count = prefetch_count
         self._connection: aio_pika.abc.AbstractRobustConnection | None = None
         self._channel: aio_pika.abc.AbstractChannel | None = None
         self._queue: aio_pika.abc.AbstractQueue | None = None
+        self._queues: dict[str, aio_pika.abc.AbstractQueue] = {}
+        self._exchanges: dict[str, aio_pika.abc.AbstractExchange] = {}
+        self._consumers: dict[str, str] = {}
+        self._in_flight: defaultdict[str, int] = defaultdict(int)
+        self._drained: defaultdict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        self._draining: set[str] = set()
+        self._held: defaultdict[str, list[AbstractIncomingMessage]] = defaultdict(list)
 
     async def connect(self) -> None:
         self._connection = await aio_pika.connect_robust(self._url)
         self._channel = await self._connection.channel()
-        self._queue = await self._channel.declare_queue(self._queue_name, durable=True)
+        if self._prefetch_count is not None:
+            await self._channel.set_qos(prefetch_count=self._prefetch_count)
+        self._queue = await self.declare(self._queue_name, self._arguments)
 
     async def close(self) -> None:
         if self._connection:
             await self._connection.close()
 
-    async def send(self, body: bytes) -> None:
+    async def declare(
+        self,
+        queue_name: str,
+        arguments: dict[str, Any] | None = None,
+    ) -> aio_pika.abc.AbstractQueue:
+        if self._channel is None:
+            raise RuntimeError("RabbitMQManager is not connected")
+        if queue_name not in self._queues:
+            self._queues[queue_name] = await self._channel.declare_queue(
+                queue_name,
+                durable=True,
+                arguments=arguments,
+            )
+        return self._queues[queue_name]
+
+    async def declare_fanout(self, exchange_name: str) -> aio_pika.abc.AbstractExchange:
+        if self._channel is None:
+            raise RuntimeError("RabbitMQManager is not connected")
+        if exchange_name not in self._exchanges:
+            self._exchanges[exchange_name] = await self._channel.declare_exchange(
+                exchange_name,
+                aio_pika.ExchangeType.FANOUT,
+                durable=True,
+            )
+        return self._exchanges[exchange_name]
+
+    async def publish(self, exchange_name: str, body: bytes) -> None:
+        exchange = await self.declare_fanout(exchange_name)
+        await exchange.publish(Message(body=body), routing_key="")
+
+    async def subscribe(
+        self,
+        exchange_name: str,
+        handler: Callable[[AbstractIncomingMessage], Awaitable[None]],
+    ) -> None:
+        # Каждый процесс получает свою временную очередь: сообщение получат все
+        if self._channel is None:
+            raise RuntimeError("RabbitMQManager is not connected")
+        exchange = await self.declare_fanout(exchange_name)
+        queue = await self._channel.declare_queue(exclusive=True, auto_delete=True)
+        await queue.bind(exchange)
+        await queue.consume(handler, no_ack=True)
+
+    async def send(self, body: bytes, queue_name: str | None = None) -> None:
         if self._channel is None:
             raise RuntimeError("RabbitMQManager is not connected")
         await self._channel.default_exchange.publish(
             Message(body=body),
-            routing_key=self._queue_name,
+            routing_key=queue_name or self._queue_name,
+        )
+
+    async def send_many(
+        self,
+        bodies: Iterable[bytes],
+        queue_name: str | None = None,
+    ) -> None:
+        # Публикации идут параллельно, подтверждения брокера ждём разом
+        if self._channel is None:
+            raise RuntimeError("RabbitMQManager is not connected")
+        exchange = self._channel.default_exchange
+        await asyncio.gather(
+            *(
+                exchange.publish(
+                    Message(body=body),
+                    routing_key=queue_name or self._queue_name,
+                )
+                for body in bodies
+            ),
+        )
+
+    @staticmethod
+    def retry_queue(queue_name: str, delay: int) -> str:
+        return f"{queue_name}.retry.{delay}"
+
+    @staticmethod
+    def dead_queue(queue_name: str) -> str:
+        return f"{queue_name}.dead"
+
+    async def declare_retries(
+        self,
+        delays: Iterable[int],
+        queue_name: str | None = None,
+    ) -> None:
+        # Каждой задержке отведена своя очередь без потребителей: TTL всех
+        # сообщений в ней одинаковый, поэтому они истекают по порядку и брокер сам
+        # возвращает их в основную очередь
+        queue_name = queue_name or self._queue_name
+        for delay in delays:
+            await self.declare(
+                self.retry_queue(queue_name, delay),
+                {
+                    "x-message-ttl": delay * 1000,
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": queue_name,
+                },
+            )
+        await self.declare(self.dead_queue(queue_name))
+
+    async def _republish(
+        self,
+        msg: AbstractIncomingMessage,
+        routing_key: str,
+        error: str,
+        attempt: int,
+    ) -> None:
+        if self._channel is None:
+            raise RuntimeError("RabbitMQManager is not connected")
+        headers = dict(msg.headers or {})
+        headers[ATTEMPT_HEADER] = attempt
+        headers[ERROR_HEADER] = error[:ERROR_HEADER_LIMIT]
+        await self._channel.default_exchange.publish(
+            # Отложенное сообщение существует только в брокере, исходное уже
+            # подтверждено, так что перезапуск брокера не должен терять такое сообщение
+            Message(
+                body=msg.body,
+                headers=headers,
+                delivery_mode=DeliveryMode.PERSISTENT,
+            ),
+            routing_key=routing_key,
+        )
+
+    @staticmethod
+    def attempt(msg: AbstractIncomingMessage) -> int:
+        attempt = (msg.headers or {}).get(ATTEMPT_HEADER)
+        return attempt if isinstance(attempt, int) else 0
+
+    async def retry(
+        self,
+        msg: AbstractIncomingMessage,
+        delays: Sequence[int],
+        error: str,
+        queue_name: str | None = None,
+    ) -> bool:
+        # Откладывает сообщение на delays[попытка] секунд. Когда попытки
+        # кончились, отправляет сообщение в очередь мёртвых писем и возвращает False.
+        # Исходное сообщение подтверждает вызывающий
+        queue_name = queue_name or self._queue_name
+        attempt = self.attempt(msg)
+        if attempt >= len(delays):
+            await self.dead_letter(msg, error, queue_name)
+            return False
+
+        await self._republish(
+            msg,
+            self.retry_queue(queue_name, delays[attempt]),
+            error,
+            attempt + 1,
+        )
+        return True
+
+    async def dead_letter(
+        self,
+        msg: AbstractIncomingMessage,
+        error: str,
+        queue_name: str | None = None,
+    ) -> None:
+        await self._republish(
+            msg,
+            self.dead_queue(queue_name or self._queue_name),
+            error,
+            self.attempt(msg),
         )
 
     async def consume(
         self,
         handler: Callable[[AbstractIncomingMessage], Awaitable[None]],
+        queue_name: str | None = None,
     ) -> None:
-        if self._queue is None:
-            raise RuntimeError("RabbitMQManager is not connected")
-        await self._queue.consume(handler)
+        queue_name = queue_name or self._queue_name
+        queue = self._queues.get(queue_name)
+        if queue is None:
+            raise RuntimeError(f"Queue {queue_name} is not declared")
+
+        async def tracked(msg: AbstractIncomingMessage) -> None:
+            if queue_name in self._draining:
+                # Очередь передаётся другому потребителю: новые сообщения
+                # не обрабатываем, после отмены они вернутся в очередь
+                if queue_name in self._consumers:
+                    self._held[queue_name].append(msg)
+                else:
+                    await msg.nack(requeue=True)
+                return
+
+            self._in_flight[queue_name] += 1
+            self._drained[queue_name].clear()
+            try:
+                await handler(msg)
+            finally:
+                self._in_flight[queue_name] -= 1
+                if self._in_flight[queue_name] == 0:
+                    self._drained[queue_name].set()
+
+        self._draining.discard(queue_name)
+        self._consumers[queue_name] = await queue.consume(tracked)
+
+    async def drain(self, queue_name: str, drain_timeout: float) -> bool:
+        # Перестаём брать новые сообщения и ждём уже начатые. Брокер отдаёт
+        # очередь следующему потребителю только после cancel, так что он
+        # не обгонит то, что ещё обрабатывается здесь. False — не дождались
+        if queue_name not in self._consumers:
+            return True
+
+        self._draining.add(queue_name)
+        if not self._in_flight[queue_name]:
+            return True
+        try:
+            await asyncio.wait_for(self._drained[queue_name].wait(), drain_timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    async def cancel(self, queue_name: str) -> None:
+        # Отложенные при drain сообщения возвращаются в очередь уже после
+        # отмены и достанутся новому потребителю
+        self._draining.add(queue_name)
+        consumer_tag = self._consumers.pop(queue_name, None)
+        if consumer_tag is not None:
+            await self._queues[queue_name].cancel(consumer_tag)
+        for msg in self._held.pop(queue_name, []):
+            await msg.nack(requeue=True)
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any
+
+Labels = tuple[tuple[str, Any], ...]
+
+
+@dataclass
+class Timing:
+    count: int = 0
+    total: float = 0
+    max: float = 0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._counters: defaultdict[str, defaultdict[Labels, int]] = defaultdict(
+            lambda: defaultdict(int),
+        )
+        self._gauges: defaultdict[str, dict[Labels, float]] = defaultdict(dict)
+        self._timings: defaultdict[str, defaultdict[Labels, Timing]] = defaultdict(
+            lambda: defaultdict(Timing),
+        )
+
+    @staticmethod
+    def _labels(labels: dict[str, Any]) -> Labels:
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: int = 1, **labels: Any) -> None:
+        self._counters[name][self._labels(labels)] += value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        self._gauges[name][self._labels(labels)] = value
+
+    def remove(self, name: str, **labels: Any) -> None:
+        self._gauges[name].pop(self._labels(labels), None)
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        self._timings[name][self._labels(labels)].observe(value)
+
+    def counter(self, name: str, **labels: Any) -> int:
+        return self._counters[name].get(self._labels(labels), 0)
+
+    def gauge(self, name: str, **labels: Any) -> float | None:
+        return self._gauges[name].get(self._labels(labels))
+
+    def timing(self, name: str, **labels: Any) -> Timing:
+        return self._timings[name].get(self._labels(labels), Timing())
+
+    def snapshot(self) -> dict[str, dict[Labels, Any]]:
+        data: dict[str, dict[Labels, Any]] = {}
+        for name, counters in self._counters.items():
+            data[name] = dict(counters)
+        for name, gauges in self._gauges.items():
+            data[name] = dict(gauges)
+        for name, timings in self._timings.items():
+            data[name] = {
+                labels: {"count": t.count, "avg": t.avg, "max": t.max}
+                for labels, t in timings.items()
+            }
+        return data
+
+
+metrics = Metrics()
+
+
+async def report_metrics(logger: logging.Logger, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        for name, values in metrics.snapshot().items():
+            for labels, value in values.items():
+                logger.info("metric %s %s %s", name, dict(labels), value)
@@ -18,6 +18,7 @@ from sqlalchemy.exc import IntegrityError
 from typing_extensions import TypedDict
 
 from app.app import setup_app
+from app.bot.models import CatalogVersionModel
 from app.core.accessor import transaction
 from app.core.database.database import BaseModel
 
@@ -138,6 +139,9 @@ async def load_data(
 
     for item in data:
         model_name: str = item["model"]
+        if model_name == CatalogVersionModel.__tablename__:
+            # Версию ведёт bump_catalog_version ниже, из файла её не берём
+            continue
         if model_name in model_map:
             item_fields: dict[str, Any] = item["fields"]
             for key, value in item_fields.items():
@@ -151,8 +155,11 @@ async def load_data(
 
     async with transaction(app.accessors.base_accessor) as session:
         if clear_before:
+            # Версия каталога только растёт, иначе боты примут новые правки
+            # за уже виденные
             for model_class in model_map.values():
-                await session.execute(delete(model_class))
+                if model_class is not CatalogVersionModel:
+                    await session.execute(delete(model_class))
             logger.info("Все таблицы очищены перед загрузкой")
 
         for model_name, items in data_by_model.items():
@@ -162,6 +169,11 @@ async def load_data(
                 obj: BaseModel = model_cls(**fields)
                 session.add(obj)
 
+        # Боты не видят прямых записей в таблицы каталога, новую версию
+        # они заметят при периодической сверке и перечитают каталог
+        version = await app.accessors.theme_accessor.bump_catalog_version()
+        logger.info("Версия каталога поднята до %d", version)
+
     logger.info("Данные успешно загружены из %s", file_path)
 
 
@@ -0,0 +1,21 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.accessor_base import BaseAccessor
+from app.poller.models import PollerOffsetModel
+
+
+class OffsetAccessor(BaseAccessor):
+    async def get(self, bot_id: int) -> int:
+        exp = select(PollerOffsetModel.offset).where(
+            PollerOffsetModel.bot_id == bot_id,
+        )
+        return await self.scalar(exp) or 0
+
+    async def commit(self, bot_id: int, offset: int) -> None:
+        exp = insert(PollerOffsetModel).values(bot_id=bot_id, offset=offset)
+        exp = exp.on_conflict_do_update(
+            index_elements=[PollerOffsetModel.bot_id],
+            set_={"offset": exp.excluded.offset},
+        )
+        await self.execute(exp)
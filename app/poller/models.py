@@ -0,0 +1,15 @@
+from sqlalchemy import BigInteger
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database.sqlalchemy_base import BaseModel
+
+
+class PollerOffsetModel(BaseModel):
+    __tablename__ = "poller_offset"
+
+    bot_id: Mapped[int] = mapped_column(
+        BigInteger,
+        primary_key=True,
+        autoincrement=False,
+    )
+    offset: Mapped[int] = mapped_column(BigInteger, default=0)
@@ -1,34 +1,133 @@
 import asyncio
 import json
-from typing import Any, cast
+import logging
+from typing import TYPE_CHECKING, Any, cast
 
 import aiohttp
 
 from app.app import app, setup_app
+from app.bot.sharding import (
+    SHARD_QUEUE_ARGUMENTS,
+    declare_shard_queues,
+    shard_queue_for_update,
+)
 from app.core.manager import RabbitMQManager
+from app.poller.webhook import run_webhook
 
+if TYPE_CHECKING:
+    from app.app import Application
 
-async def get_updates(url: str, offset: int) -> dict[str, Any]:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params={"offset": offset, "timeout": 30}) as resp:
-            return cast(dict[str, Any], await resp.json())
+logger = logging.getLogger(__name__)
 
 
-async def poll_and_push() -> None:
-    rabbit = RabbitMQManager(
-        amqp_url=app.config.rabbitmq.url,
-        queue_name=app.config.rabbitmq.input_queue,
-    )
-    await rabbit.connect()
+class Poller:
+    def __init__(self, app: "Application"):
+        self.app = app
+        self._config = app.config.poller
+        self._bot_id = int(app.config.bot.token.split(":")[0])
+        self._url = app.bot_api.build_method_url("getUpdates")
+        self._session: aiohttp.ClientSession | None = None
+        self._rabbit = RabbitMQManager(
+            amqp_url=app.config.rabbitmq.url,
+            queue_name=app.config.rabbitmq.input_shard_queue(0),
+            arguments=SHARD_QUEUE_ARGUMENTS,
+        )
+
+    async def connect(self) -> None:
+        self.app.database.connect()
+        await self._rabbit.connect()
+        await declare_shard_queues(self._rabbit, self.app.config.rabbitmq)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=1,
+                keepalive_timeout=self._config.keepalive_timeout,
+            ),
+            timeout=aiohttp.ClientTimeout(total=self._config.timeout + 10),
+        )
+
+    async def close(self) -> None:
+        if self._session:
+            await self._session.close()
+        await self._rabbit.close()
+        await self.app.database.disconnect()
+
+    async def get_updates(self, offset: int) -> list[dict[str, Any]]:
+        if self._session is None:
+            raise RuntimeError("Poller is not connected")
+
+        params = {
+            "offset": offset,
+            "timeout": self._config.timeout,
+            "limit": self._config.limit,
+        }
+        async with self._session.get(self._url, params=params) as resp:
+            data = cast(dict[str, Any], await resp.json())
+
+        if not data.get("ok"):
+            raise RuntimeError(f"Telegram API error: {data}")
+        return cast(list[dict[str, Any]], data.get("result", []))
+
+    async def push(self, updates: list[dict[str, Any]]) -> None:
+        # Порядок внутри шарда сохраняется: публикации в канале идут по очереди
+        config = self.app.config.rabbitmq
+        shards: dict[str, list[bytes]] = {}
+        for update in updates:
+            shards.setdefault(shard_queue_for_update(config, update), []).append(
+                json.dumps(update).encode(),
+            )
+
+        await asyncio.gather(
+            *(
+                self._rabbit.send_many(bodies, queue_name)
+                for queue_name, bodies in shards.items()
+            ),
+        )
 
-    offset = 0
-    while True:
-        data = await get_updates(app.bot_api.build_method_url("getUpdates"), offset)
-        for update in data.get("result", []):
-            offset = update["update_id"] + 1
-            await rabbit.send(json.dumps(update).encode())
+    async def delete_webhook(self) -> None:
+        # getUpdates не работает, пока для бота установлен вебхук
+        if self._session is None:
+            raise RuntimeError("Poller is not connected")
+
+        async with self._session.post(
+            self.app.bot_api.build_method_url("deleteWebhook"),
+        ) as resp:
+            await resp.read()
+
+    async def run(self) -> None:
+        await self.delete_webhook()
+        offset = await self.app.accessors.offset_accessor.get(self._bot_id)
+
+        while True:
+            try:
+                updates = await self.get_updates(offset)
+            except (aiohttp.ClientError, TimeoutError, RuntimeError):
+                logger.exception("Не удалось получить обновления")
+                await asyncio.sleep(self._config.retry_delay)
+                continue
+
+            if not updates:
+                continue
+
+            # Смещение фиксируем только после подтверждения всей пачки брокером,
+            # иначе при падении обновления потеряются
+            await self.push(updates)
+            offset = updates[-1]["update_id"] + 1
+            await self.app.accessors.offset_accessor.commit(self._bot_id, offset)
+
+
+async def poll_and_push() -> None:
+    poller = Poller(app)
+    await poller.connect()
+    try:
+        await poller.run()
+    finally:
+        await poller.close()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     setup_app()
-    asyncio.run(poll_and_push())
+    if app.config.poller.mode == "webhook":
+        run_webhook(app)
+    else:
+        asyncio.run(poll_and_push())
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any
+
+import aiofiles
+import aiohttp
+
+from app.poller.webhook import SECRET_TOKEN_HEADER
+
+logger = logging.getLogger(__name__)
+
+
+async def read_updates(file_path: str) -> list[dict[str, Any]]:
+    async with aiofiles.open(file_path, encoding="utf-8") as f:
+        content = await f.read()
+
+    if Path(file_path).suffix == ".jsonl":
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+    return list(json.loads(content))
+
+
+async def replay(
+    updates: list[dict[str, Any]],
+    url: str,
+    secret: str | None,
+    *,
+    concurrency: int,
+    repeat: int,
+) -> None:
+    headers = {SECRET_TOKEN_HEADER: secret} if secret else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def post(session: aiohttp.ClientSession, update: dict[str, Any]) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as resp:
+                await resp.read()
+                if resp.status != HTTPStatus.OK:
+                    errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    # Update_id переписываем, чтобы повторы выглядели как новые обновления
+    batch = []
+    update_id = 0
+    for _ in range(repeat):
+        for update in updates:
+            update_id += 1
+            batch.append({**update, "update_id": update_id})
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(post(session, update) for update in batch))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    logger.info(
+        "Отправлено %d обновлений за %.2f с (%.0f rps), ошибок: %d, "
+        "p50: %.1f мс, p99: %.1f мс",
+        len(batch),
+        elapsed,
+        len(batch) / elapsed,
+        errors,
+        latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.99)] * 1000,
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Проигрывает записанные обновления как POST-запросы вебхука",
+    )
+    parser.add_argument("file_path", type=str, help="Путь к JSON/JSONL-файлу")
+    parser.add_argument(
+        "--url",
+        type=str,
+        default="http://localhost:8081/webhook",
+        help="Адрес вебхука",
+    )
+    parser.add_argument("--secret", type=str, default=None, help="Секретный токен")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    updates = await read_updates(args.file_path)
+    if not updates:
+        logger.info("Файл не содержит обновлений")
+        return
+
+    await replay(
+        updates,
+        args.url,
+        args.secret,
+        concurrency=args.concurrency,
+        repeat=args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+import hmac
+import json
+import logging
+from typing import TYPE_CHECKING, Any
+
+import aiohttp
+from aiohttp import web
+
+from app.bot.sharding import (
+    SHARD_QUEUE_ARGUMENTS,
+    declare_shard_queues,
+    shard_queue_for_update,
+)
+from app.core.manager import RabbitMQManager
+
+if TYPE_CHECKING:
+    from app.app import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookReceiver:
+    def __init__(self, app: "Application"):
+        self.app = app
+        self._config = app.config.poller
+        # Без секрета любой, кто знает адрес, сможет подсовывать апдейты
+        if not self._config.webhook_secret:
+            raise RuntimeError("POLLER__WEBHOOK_SECRET is required in webhook mode")
+        self._secret = self._config.webhook_secret
+        self._rabbit = RabbitMQManager(
+            amqp_url=app.config.rabbitmq.url,
+            queue_name=app.config.rabbitmq.input_shard_queue(0),
+            arguments=SHARD_QUEUE_ARGUMENTS,
+        )
+
+    async def connect(self, *args: Any, **kwargs: Any) -> None:
+        await self._rabbit.connect()
+        await declare_shard_queues(self._rabbit, self.app.config.rabbitmq)
+        if self._config.webhook_url is not None:
+            await self.register()
+
+    async def close(self, *args: Any, **kwargs: Any) -> None:
+        await self._rabbit.close()
+
+    async def register(self) -> None:
+        payload: dict[str, Any] = {
+            "url": self._config.webhook_url,
+            "max_connections": self._config.webhook_max_connections,
+            "secret_token": self._secret,
+        }
+
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                self.app.bot_api.build_method_url("setWebhook"),
+                json=payload,
+            ) as resp:
+                data = await resp.json()
+
+        if not data.get("ok"):
+            raise RuntimeError(f"Telegram API error: {data}")
+
+    def check_secret(self, request: web.Request) -> bool:
+        return hmac.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, ""),
+            self._secret,
+        )
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self.check_secret(request):
+            raise web.HTTPUnauthorized
+
+        try:
+            update = await request.json()
+        except json.JSONDecodeError as e:
+            raise web.HTTPBadRequest from e
+
+        # 200 отдаём только после подтверждения брокером, иначе Telegram повторит
+        await self._rabbit.send(
+            json.dumps(update).encode(),
+            shard_queue_for_update(self.app.config.rabbitmq, update),
+        )
+        return web.Response()
+
+    def make_app(self) -> web.Application:
+        webhook_app = web.Application()
+        webhook_app.router.add_post(self._config.webhook_path, self.handle)
+        webhook_app.on_startup.append(self.connect)
+        webhook_app.on_cleanup.append(self.close)
+        return webhook_app
+
+
+def run_webhook(app: "Application") -> None:
+    receiver = WebhookReceiver(app)
+    web.run_app(
+        receiver.make_app(),
+        host=app.config.poller.webhook_host,
+        port=app.config.poller.webhook_port,
+    )
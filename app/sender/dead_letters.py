@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import logging
+
+from aio_pika.abc import AbstractIncomingMessage
+
+from app.app import setup_app
+from app.core.lanes import OutputLane
+from app.core.manager import ATTEMPT_HEADER, ERROR_HEADER, RabbitMQManager
+
+app = setup_app()
+logger = logging.getLogger(__name__)
+
+
+async def fetch(
+    rabbit: RabbitMQManager,
+    queue_name: str,
+    limit: int | None,
+) -> list[AbstractIncomingMessage]:
+    # Полученные без подтверждения сообщения брокер повторно не выдаёт,
+    # так что каждое попадёт в список один раз
+    queue = await rabbit.declare(queue_name)
+    messages: list[AbstractIncomingMessage] = []
+    while limit is None or len(messages) < limit:
+        msg = await queue.get(no_ack=False, fail=False)
+        if msg is None:
+            break
+        messages.append(msg)
+    return messages
+
+
+async def show(rabbit: RabbitMQManager, queue_name: str, limit: int | None) -> None:
+    messages = await fetch(rabbit, queue_name, limit)
+    for msg in messages:
+        headers = msg.headers or {}
+        logger.info(
+            "[%s] %s\n    %s",
+            headers.get(ATTEMPT_HEADER, 0),
+            headers.get(ERROR_HEADER, ""),
+            msg.body.decode(),
+        )
+    for msg in messages:
+        await msg.nack(requeue=True)
+    logger.info("В очереди %s показано %s сообщений", queue_name, len(messages))
+
+
+async def replay(
+    rabbit: RabbitMQManager,
+    queue_name: str,
+    output_queue: str,
+    limit: int | None,
+) -> None:
+    # Счётчик попыток сбрасывается: письмо снова проходит всю цепочку повторов
+    messages = await fetch(rabbit, queue_name, limit)
+    for msg in messages:
+        await rabbit.send(msg.body, output_queue)
+        await msg.ack()
+    logger.info("В очередь %s возвращено %s сообщений", output_queue, len(messages))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Просмотр и повторная отправка мёртвых писем отправщика",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    for command, help_text in (
+        ("show", "Показать сообщения, не вернув их из очереди"),
+        ("replay", "Вернуть сообщения в очередь отправки"),
+    ):
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument(
+            "--lane",
+            choices=[lane.value for lane in OutputLane],
+            default=None,
+            help="Полоса очереди отправки (по умолчанию все)",
+        )
+        subparser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Сколько сообщений обработать (по умолчанию все)",
+        )
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        return
+
+    lanes: list[OutputLane] = (
+        list(OutputLane) if args.lane is None else [OutputLane(args.lane)]
+    )
+    rabbit = RabbitMQManager(
+        amqp_url=app.config.rabbitmq.url,
+        queue_name=app.config.rabbitmq.output_queue,
+    )
+    await rabbit.connect()
+    try:
+        for lane in lanes:
+            output_queue = app.config.rabbitmq.output_lane_queue(lane)
+            dead_queue = rabbit.dead_queue(output_queue)
+            if args.command == "show":
+                await show(rabbit, dead_queue, args.limit)
+            else:
+                await replay(rabbit, dead_queue, output_queue, args.limit)
+    finally:
+        await rabbit.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    asyncio.run(main())
@@ -0,0 +1,23 @@
+from typing import Any
+
+# Коды, при которых повтор ничего не изменит: неверный запрос, бот заблокирован,
+# чат или сообщение не найдены
+PERMANENT_CODES = frozenset({400, 401, 403, 404})
+TOO_MANY_REQUESTS = 429
+
+
+class TelegramError(RuntimeError):
+    def __init__(self, response: dict[str, Any]):
+        super().__init__(f"Telegram API error: {response}")
+        self.code: int | None = response.get("error_code")
+        self.description: str = response.get("description", "")
+
+    @property
+    def permanent(self) -> bool:
+        return self.code in PERMANENT_CODES
+
+
+class RetryAfterError(TelegramError):
+    def __init__(self, response: dict[str, Any]):
+        super().__init__(response)
+        self.seconds: float = response.get("parameters", {}).get("retry_after", 1)
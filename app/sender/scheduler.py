@@ -0,0 +1,288 @@
+import asyncio
+import contextlib
+import logging
+import math
+import time
+from collections import defaultdict, deque
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from app.core.lanes import OutputLane
+from app.core.metrics import metrics
+from app.sender.errors import RetryAfterError
+
+if TYPE_CHECKING:
+    from app.core.config import SenderConfig
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+ChatKey = int | str | None
+
+
+def weighted_cycle(weights: dict[OutputLane, int]) -> list[OutputLane]:
+    # Плавный взвешенный круг, как в nginx: при весах 8/3/1 полосы перемежаются,
+    # вместо того чтобы идти пачками по восемь
+    total = sum(weights.values())
+    current = dict.fromkeys(weights, 0)
+    cycle = []
+    for _ in range(total):
+        for lane, weight in weights.items():
+            current[lane] += weight
+        lane = max(current, key=lambda x: current[x])
+        current[lane] -= total
+        cycle.append(lane)
+    return cycle
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+
+@dataclass
+class _Pending:
+    job: Job
+    done: asyncio.Future[None]
+    enqueued_at: float
+    lane: OutputLane
+    key: Hashable | None = None
+    attempts: int = 0
+
+
+@dataclass
+class _Chat:
+    buckets: list[TokenBucket]
+    queues: defaultdict[OutputLane, deque[_Pending]] = field(
+        default_factory=lambda: defaultdict(deque),
+    )
+    blocked_until: float = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+# Отправка по лимитам Telegram: общий бакет на бота, свой бакет на чат
+# (и ещё поминутный для групп). Чаты обходятся по кругу, так что одна шумная
+# игра не задерживает остальные. Получив 429, чат замирает на retry_after секунд,
+# сообщение же возвращается в начало очереди чата.
+# Каждая полоса обходит свой круг чатов, полосы чередуются по весам из конфига.
+# Слот полосы, которой нечего отправить, достаётся следующей.
+# Задания под одинаковым ключом схлопываются: пока старое ждёт в очереди, новое
+# занимает место старого, и старое завершается без отправки
+class DeliveryScheduler:
+    IDLE_TTL = 60
+
+    def __init__(self, config: "SenderConfig"):
+        self._config = config
+        self._global = TokenBucket(config.global_rate, config.global_rate)
+        self._global_blocked_until: float = 0
+        self._chats: dict[ChatKey, _Chat] = {}
+        self._rings: dict[OutputLane, deque[ChatKey]] = {
+            lane: deque() for lane in OutputLane
+        }
+        self._cycle = weighted_cycle(
+            {
+                OutputLane.CALLBACK: config.callback_weight,
+                OutputLane.EDIT: config.edit_weight,
+                OutputLane.SEND: config.send_weight,
+            },
+        )
+        self._cursor = 0
+        self._latest: dict[Hashable, _Pending] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def _chat(self, chat_id: ChatKey) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            buckets = []
+            if chat_id is not None:
+                buckets.append(TokenBucket(self._config.chat_rate, 1))
+                if isinstance(chat_id, int) and chat_id < 0:
+                    per_minute = self._config.group_rate_per_minute
+                    buckets.append(TokenBucket(per_minute / 60, per_minute))
+            chat = self._chats[chat_id] = _Chat(buckets)
+        return chat
+
+    async def submit(
+        self,
+        chat_id: ChatKey,
+        job: Job,
+        lane: OutputLane = OutputLane.SEND,
+        key: Hashable | None = None,
+    ) -> None:
+        await self.enqueue(chat_id, job, lane, key)
+
+    def enqueue(
+        self,
+        chat_id: ChatKey,
+        job: Job,
+        lane: OutputLane = OutputLane.SEND,
+        key: Hashable | None = None,
+    ) -> asyncio.Future[None]:
+        # Ставит задание в очередь чата сразу, без await, так что порядок
+        # заданий повторяет порядок вызовов. Future завершится, когда задание
+        # отправят
+        done = asyncio.get_running_loop().create_future()
+        stale = None if key is None else self._latest.get(key)
+        if stale is not None:
+            # Место в очереди остаётся за старым заданием, так что новое
+            # не ждёт дольше, чем ждало бы старое
+            stale.done.set_result(None)
+            stale.job = job
+            stale.done = done
+            metrics.inc("sender_saved", reason="coalesced")
+            return done
+
+        chat = self._chat(chat_id)
+        pending = _Pending(job, done, time.monotonic(), lane, key)
+        queue = chat.queues[lane]
+        if not queue:
+            self._rings[lane].append(chat_id)
+        queue.append(pending)
+        if key is not None:
+            self._latest[key] = pending
+        self._wakeup.set()
+        return done
+
+    def _ready_at(self, chat: _Chat, now: float) -> float:
+        return max(
+            [chat.blocked_until, *(bucket.ready_at(now) for bucket in chat.buckets)],
+        )
+
+    def _take(self, lane: OutputLane, now: float) -> float | None:
+        # Отправляет первое готовое сообщение полосы и возвращает None,
+        # иначе — когда освободится ближайший чат
+        ring = self._rings[lane]
+        next_at = math.inf
+        for _ in range(len(ring)):
+            chat_id = ring.popleft()
+            chat = self._chats[chat_id]
+            ready_at = self._ready_at(chat, now)
+            if ready_at > now:
+                ring.append(chat_id)
+                next_at = min(next_at, ready_at)
+                continue
+
+            queue = chat.queues[lane]
+            pending = queue.popleft()
+            if queue:
+                ring.append(chat_id)
+            self._start(chat_id, chat, pending, now)
+            return None
+        return next_at
+
+    def _start(
+        self,
+        chat_id: ChatKey,
+        chat: _Chat,
+        pending: _Pending,
+        now: float,
+    ) -> None:
+        if pending.key is not None:
+            del self._latest[pending.key]
+        self._global.take(now)
+        for bucket in chat.buckets:
+            bucket.take(now)
+        chat.last_used = now
+
+        metrics.observe(
+            "sender_queue_delay_seconds",
+            now - pending.enqueued_at,
+            lane=pending.lane,
+        )
+        task = asyncio.create_task(self._execute(chat_id, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _dispatch(self, now: float) -> float | None:
+        # Возвращает момент, когда стоит проверить снова, или None, если ждать нечего
+        while any(self._rings.values()):
+            global_at = max(self._global.ready_at(now), self._global_blocked_until)
+            if global_at > now:
+                return global_at
+
+            next_at = math.inf
+            for _ in range(len(self._cycle)):
+                lane = self._cycle[self._cursor]
+                self._cursor = (self._cursor + 1) % len(self._cycle)
+                ready_at = self._take(lane, now)
+                if ready_at is None:
+                    break
+                next_at = min(next_at, ready_at)
+            else:
+                return next_at
+        return None
+
+    async def _execute(self, chat_id: ChatKey, pending: _Pending) -> None:
+        try:
+            await pending.job()
+        except RetryAfterError as e:
+            pending.attempts += 1
+            metrics.inc("sender_retry_after")
+            if pending.attempts > self._config.max_retries:
+                pending.done.set_exception(e)
+                return
+
+            if pending.key is not None:
+                if pending.key in self._latest:
+                    # Пока ждали, пришла более свежая версия — повторять нечего
+                    pending.done.set_result(None)
+                    metrics.inc("sender_saved", reason="coalesced")
+                    return
+                self._latest[pending.key] = pending
+
+            chat = self._chat(chat_id)
+            until = time.monotonic() + e.seconds
+            if chat_id is None:
+                self._global_blocked_until = max(self._global_blocked_until, until)
+            chat.blocked_until = max(chat.blocked_until, until)
+            queue = chat.queues[pending.lane]
+            if not queue:
+                self._rings[pending.lane].append(chat_id)
+            queue.appendleft(pending)
+            self._wakeup.set()
+        except Exception as e:
+            pending.done.set_exception(e)
+        else:
+            pending.done.set_result(None)
+
+    def _purge(self, now: float) -> None:
+        for chat_id in [
+            chat_id
+            for chat_id, chat in self._chats.items()
+            if not any(chat.queues.values()) and now - chat.last_used > self.IDLE_TTL
+        ]:
+            del self._chats[chat_id]
+
+    async def run(self) -> None:
+        purged_at = time.monotonic()
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            next_at = self._dispatch(now)
+
+            if now - purged_at > self.IDLE_TTL:
+                self._purge(now)
+                purged_at = now
+
+            timeout = None if next_at is None else next_at - now
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
@@ -1,41 +1,225 @@
 import asyncio
 import json
-from typing import Any
+import logging
+import time
+from collections import Counter
+from functools import partial
+from typing import TYPE_CHECKING, Any
 
 import aiohttp
+from aio_pika.abc import AbstractIncomingMessage
 
 from app.app import app, setup_app
+from app.core.lanes import OutputLane, lane_for_method
 from app.core.manager import RabbitMQManager
+from app.core.metrics import metrics, report_metrics
+from app.sender.errors import TOO_MANY_REQUESTS, RetryAfterError, TelegramError
+from app.sender.scheduler import DeliveryScheduler
 
+if TYPE_CHECKING:
+    from app.app import Application
 
-async def handle_message(msg):
-    async with msg.process():
-        try:
-            payload = json.loads(msg.body)
-            method_url = payload["method"]
-            data = payload.get("data", {})
+logger = logging.getLogger(__name__)
+
+EditKey = tuple[Any, Any]
+# Telegram отвечает так на правку без изменений, сообщение при этом в порядке
+NOT_MODIFIED = "message is not modified"
+
+
+def method_name(payload: dict[str, Any]) -> str:
+    return str(payload["method"]).rsplit("/", 1)[-1]
+
+
+def edit_key(payload: dict[str, Any]) -> EditKey | None:
+    if method_name(payload) != "editMessageText":
+        return None
+    data = payload.get("data", {})
+    return data.get("chat_id"), data.get("message_id")
+
+
+# Одна долгоживущая сессия на весь процесс: соединения до api.telegram.org
+# переиспользуются, TLS-рукопожатие не повторяется на каждом сообщении.
+# Параллельно в полёте не больше SENDER__CONCURRENCY запросов, темп же отправки
+# задаёт DeliveryScheduler по лимитам Telegram
+class Sender:
+    def __init__(self, app: "Application"):
+        self.app = app
+        self._config = app.config.sender
+        self._session: aiohttp.ClientSession | None = None
+        self._semaphore = asyncio.Semaphore(self._config.concurrency)
+        self._in_flight = 0
+        # chat_id -> сколько неподтверждённых сообщений чата держит процесс
+        self._backlog: Counter[Any] = Counter()
+        self._buffer = asyncio.Semaphore(self._config.buffer_size)
+        self._scheduler = DeliveryScheduler(self._config)
+        self._rabbit = RabbitMQManager(
+            amqp_url=app.config.rabbitmq.url,
+            queue_name=app.config.rabbitmq.output_queue,
+            prefetch_count=self._config.prefetch_count,
+        )
+
+    async def connect(self) -> None:
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self._config.concurrency,
+                limit_per_host=self._config.limit_per_host,
+                keepalive_timeout=self._config.keepalive_timeout,
+                ttl_dns_cache=self._config.dns_cache_ttl,
+            ),
+            timeout=aiohttp.ClientTimeout(total=self._config.timeout),
+        )
+        await self._rabbit.connect()
+        for lane in OutputLane:
+            queue_name = self.app.config.rabbitmq.output_lane_queue(lane)
+            await self._rabbit.declare(queue_name)
+            await self._rabbit.declare_retries(self._config.retry_delays, queue_name)
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(method_url, json=data) as resp:
+    async def close(self) -> None:
+        await self._rabbit.close()
+        if self._session:
+            await self._session.close()
+
+    async def deliver(self, payload: dict[str, Any]) -> None:
+        if self._session is None:
+            raise RuntimeError("Sender is not connected")
+
+        async with self._semaphore:
+            self._in_flight += 1
+            metrics.set("sender_in_flight", self._in_flight)
+            started = time.monotonic()
+            try:
+                async with self._session.post(
+                    payload["method"],
+                    json=payload.get("data", {}),
+                ) as resp:
                     response_data: dict[str, Any] = await resp.json()
+            finally:
+                self._in_flight -= 1
+            metrics.observe("sender_request_seconds", time.monotonic() - started)
+
+        if response_data.get("error_code") == TOO_MANY_REQUESTS:
+            raise RetryAfterError(response_data)
+        if not response_data.get("ok"):
+            if NOT_MODIFIED not in response_data.get("description", ""):
+                raise TelegramError(response_data)
+            metrics.inc("sender_saved", reason="identical")
+
+        metrics.inc("sender_delivered", lane=lane_for_method(method_name(payload)))
+
+    async def handle_message(
+        self,
+        msg: AbstractIncomingMessage,
+        lane: OutputLane = OutputLane.SEND,
+    ) -> None:
+        # Семафор берётся уже внутри deliver: сообщения, ждущие своей очереди
+        # в планировщике, не должны занимать слоты остальных чатов.
+        # Неудачная отправка не выбрасывается наружу: сообщение уходит
+        # в отложенную очередь или в мёртвые письма, исходное же подтверждается
+        async with msg.process(ignore_processed=True):
+            payload = json.loads(msg.body)
+            chat_id = payload.get("data", {}).get("chat_id")
+            # Очередь чата в планировщике растёт, ведь чат отправляет не чаще
+            # раза в секунду. Чтобы шумный чат не занял prefetch всех полос,
+            # сообщения сверх SENDER__CHAT_BACKLOG подтверждаются сразу
+            # и ждут в очереди чата, порядок при этом сохраняется. Подтверждённых,
+            # но не отправленных сообщений не больше SENDER__BUFFER_SIZE: дальше
+            # подтверждение ждёт места и брокер упирается в prefetch
+            done = self._scheduler.enqueue(
+                chat_id,
+                lambda: self.deliver(payload),
+                lane,
+                edit_key(payload),
+            )
+            held = buffered = False
+            if chat_id is not None:
+                if self._backlog[chat_id] < self._config.chat_backlog:
+                    self._backlog[chat_id] += 1
+                    held = True
+                else:
+                    metrics.inc("sender_buffered", lane=lane)
+
+            try:
+                if chat_id is not None and not held:
+                    await self._buffer.acquire()
+                    buffered = True
+                    await msg.ack()
+                await done
+            except Exception as e:
+                await self._fail(msg, lane, e)
+            finally:
+                if buffered:
+                    self._buffer.release()
+                if held:
+                    self._backlog[chat_id] -= 1
+                    if not self._backlog[chat_id]:
+                        del self._backlog[chat_id]
+
+    async def _fail(
+        self,
+        msg: AbstractIncomingMessage,
+        lane: OutputLane,
+        error: Exception,
+    ) -> None:
+        if not isinstance(error, TelegramError):
+            await self._retry(msg, lane, error)
+            logger.error(
+                "[sender] Exception while processing message",
+                exc_info=error,
+            )
+            return
 
-                    if not response_data.get("ok"):
-                        raise RuntimeError(f"Telegram API error: {response_data}")
-        except Exception as e:
-            raise RuntimeError("[sender] Exception while processing message") from e
+        if error.permanent:
+            await self._rabbit.dead_letter(
+                msg,
+                str(error),
+                self.app.config.rabbitmq.output_lane_queue(lane),
+            )
+            metrics.inc("sender_failed", lane=lane, result="dead")
+        else:
+            await self._retry(msg, lane, error)
+        logger.warning("[sender] %s", error)
 
+    async def _retry(
+        self,
+        msg: AbstractIncomingMessage,
+        lane: OutputLane,
+        error: Exception,
+    ) -> None:
+        if await self._rabbit.retry(
+            msg,
+            self._config.retry_delays,
+            repr(error),
+            self.app.config.rabbitmq.output_lane_queue(lane),
+        ):
+            metrics.inc("sender_failed", lane=lane, result="retry")
+        else:
+            metrics.inc("sender_failed", lane=lane, result="dead")
+
+    async def run(self) -> None:
+        scheduler = asyncio.create_task(self._scheduler.run())
+        try:
+            # Каждая полоса получает свой потребитель и своё окно prefetch, так что
+            # поток обычных сообщений не занимает место ответов на кнопки
+            for lane in OutputLane:
+                await self._rabbit.consume(
+                    partial(self.handle_message, lane=lane),
+                    self.app.config.rabbitmq.output_lane_queue(lane),
+                )
+            await report_metrics(logger, self.app.config.bot.metrics_interval)
+        finally:
+            scheduler.cancel()
 
-async def main():
-    rabbit = RabbitMQManager(
-        amqp_url=app.config.rabbitmq.url,
-        queue_name=app.config.rabbitmq.output_queue,
-    )
-    await rabbit.connect()
-    await rabbit.consume(handle_message)
 
-    await asyncio.Event().wait()
+async def main() -> None:
+    sender = Sender(app)
+    await sender.connect()
+    try:
+        await sender.run()
+    finally:
+        await sender.close()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     setup_app()
     asyncio.run(main())